@@ -0,0 +1,524 @@
+"""
+Prebuilt binary index of the author list.
+
+The plain text author list (authors_clean.txt) is compiled into a binary
+file that consists of a small header, a table of little-endian offsets and
+a blob of UTF-8 encoded names. The file is memory-mapped once per container
+and the names are sorted, so they can be searched with `bisect` without ever
+loading the whole list into memory.
+
+Next to the names the index holds a character trigram inverted index, which
+is used to prune the candidates of a fuzzy search before the (slow) exact
+similarity scoring of difflib. The names are also bucketed by a phonetic
+key (see phonetic_key), so names misheard by speech recognition can be found
+with a single lookup.
+
+The names are also stored in their spoken forms ('vogel steven' and 'steven
+vogel' for 'vogel, steven'). The forms are folded (see fold), so speech
+transcripts without diacritics or punctuation match them exactly. The sorted
+table of spoken forms works as a token trie, which is walked to spot author
+names in a sentence.
+
+The index of a text file is looked up next to it (e.g. authors_clean.txt.idx)
+and if it is missing or out of date, it is built into the temp directory
+(/tmp in Lambda). The index can be prebuilt with:
+
+    python author_index.py authors_clean.txt
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+import re
+import tempfile
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from math import ceil
+
+
+_MAGIC = b'LIBBYIDX'
+
+# Bump this whenever the sections of the index change
+_VERSION = 5
+
+# magic, version, size of the source file, crc32 of the source file,
+# section count
+_HEADER = struct.Struct('<8sIIII')
+
+# section name, offset of the section in the file, item count
+_SECTION = struct.Struct('<16sII')
+
+_OFFSET = struct.Struct('<I')
+_PAIR = struct.Struct('<II')
+
+# Anything that is not a letter or a number is dropped when folding
+_punctuation = re.compile(r'[\W_]+')
+
+# Rewrite rules of phonetic_key, applied in order to every word
+_PHONETIC_RULES = [
+    (re.compile(r'[^a-z]'), ''),
+    (re.compile(r'(.)\1+'), r'\1'),
+    (re.compile(r'sch|sh|zh'), 's'),
+    (re.compile(r'ph|v|w'), 'f'),
+    (re.compile(r'c(?=[eiy])|z'), 's'),
+    (re.compile(r'ck|ch|kh|c|q|g'), 'k'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'th|dt|d'), 't'),
+    (re.compile(r'b'), 'p'),
+    (re.compile(r'(?<=.)h'), ''),
+    (re.compile(r'^[aeiouy]+'), 'a'),
+    (re.compile(r'(?<=.)[aeiouy]'), ''),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+# Indexes that have already been opened in this container, by file name
+_indexes = {}
+
+
+class _Array(object):
+    """
+    Read-only sequence of byte strings stored in a buffer as an offsets
+    table followed by a blob.
+    """
+
+    def __init__(self, buf, offset, count):
+        self._buf = buf
+        self._count = count
+        self._table = offset
+        self._blob = offset + _OFFSET.size * (count + 1)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError('index out of range')
+
+        start, end = _PAIR.unpack_from(self._buf, self._table + _OFFSET.size * i)
+        return self._buf[self._blob + start:self._blob + end]
+
+
+class _Strings(_Array):
+    """ Same as _Array, but the items are decoded to strings """
+
+    def __getitem__(self, i):
+        return _Array.__getitem__(self, i).decode('utf-8')
+
+
+class AuthorIndex(object):
+    """
+    A memory-mapped author index. Behaves like a sorted, read-only list
+    of the author names, so it can be searched with `bisect`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.source_size, self.source_crc, count = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('Not an author index of this version: ' + path)
+
+        self._sections = {}
+        for i in range(0, count):
+            name, offset, items = _SECTION.unpack_from(
+                self._mmap, _HEADER.size + _SECTION.size * i)
+            self._sections[name.rstrip(b'\0').decode('ascii')] = (offset, items)
+
+        self.names = self.section('names', _Strings)
+        self._lengths = self.section('lengths')
+        self._grams = self.section('grams')
+        self._postings = self.section('postings')
+        self._phonetic = self.section('phonetic')
+        self._phonetic_ids = self.section('phonetic_ids')
+        self._spoken = self.section('spoken', _Strings)
+        self._spoken_ids = self.section('spoken_ids')
+
+    def section(self, name, cls=_Array):
+        """
+        Returns the named section of the index
+        :param name: name of the section
+        :param cls: _Array for raw bytes, _Strings for decoded strings
+        """
+        offset, count = self._sections[name]
+        return cls(self._mmap, offset, count)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return self.names[i]
+
+    def __contains__(self, name):
+        i = bisect_left(self.names, name)
+        return i < len(self.names) and self.names[i] == name
+
+    def _gram_ids(self, gram):
+        """ Returns the ids of the names that contain the trigram key """
+        key = gram.encode('utf-8')
+        i = bisect_left(self._grams, key)
+        if i < len(self._grams) and self._grams[i] == key:
+            return _ids(self._postings[i])
+        return ()
+
+    def candidates(self, word, cutoff=0.9):
+        """
+        Returns the names that can have a difflib similarity ratio of at
+        least cutoff with word. The pruning is lossless: every name that
+        get_close_matches would accept is among the candidates.
+
+        A ratio of 2*M/T >= cutoff (M matching characters, T the total
+        length) leaves at most T - 2*M unmatched characters, so the matching
+        blocks number at most T - 2*M + 1. Each block of length l shares
+        at least l - 2 trigrams, so the names must share at least
+        5*M - 2*T - 2 trigrams with the word.
+        :param word: the (lowercase) word that is searched
+        :param cutoff: the minimum similarity ratio, between 0 and 1
+        :return: a list of names
+        """
+        la = len(word)
+        if la == 0:
+            return []
+
+        def needed(lb):
+            total = la + lb
+            matches = int(ceil(cutoff * total / 2))
+            return 5 * matches - 2 * total - 2
+
+        # Only names with a length within these limits can reach the cutoff
+        lo = int(ceil(cutoff * la / (2 - cutoff)))
+        hi = int(la * (2 - cutoff) / cutoff)
+        hi = min(hi, len(self._lengths) - 1)
+
+        res = []
+
+        # Short names share too few trigrams to be pruned, all of them are
+        # candidates as long as their length fits
+        pruned = []
+        for lb in range(lo, hi + 1):
+            if needed(lb) <= 0:
+                res.extend(self.names[i] for i in _ids(self._lengths[lb]))
+            else:
+                pruned.append(lb)
+
+        if pruned:
+            counts = Counter()
+            for gram in trigrams(word):
+                counts.update(self._gram_ids(gram))
+
+            least = min(map(needed, pruned))
+            for i, count in counts.items():
+                if count >= least:
+                    name = self.names[i]
+                    if len(name) in pruned and count >= needed(len(name)):
+                        res.append(name)
+
+        return res
+
+    def scored_matches(self, word, n=1, cutoff=0.9):
+        """
+        Returns the n best names that have a similarity ratio of at least
+        cutoff with word, as (ratio, name) tuples, best first. Only the
+        candidates found with the trigram index are scored, the same way
+        difflib.get_close_matches scores them.
+        """
+        s = SequenceMatcher()
+        s.set_seq2(word)
+
+        result = []
+        for name in self.candidates(word, cutoff):
+            s.set_seq1(name)
+            if s.real_quick_ratio() >= cutoff and \
+                    s.quick_ratio() >= cutoff and s.ratio() >= cutoff:
+                result.append((s.ratio(), name))
+
+        return heapq.nlargest(n, result)
+
+    def close_matches(self, word, n=1, cutoff=0.9):
+        """
+        Same as difflib.get_close_matches(word, names, n, cutoff), but only
+        the candidates found with the trigram index are scored.
+        """
+        return [name for _, name in self.scored_matches(word, n, cutoff)]
+
+    def sounds_like(self, text):
+        """
+        Returns the names that have the same phonetic key as text, e.g.
+        'vogel, steven' for 'fogel stephen'.
+        """
+        key = phonetic_key(text).encode('ascii')
+        if not key:
+            return []
+
+        i = bisect_left(self._phonetic, key)
+        if i < len(self._phonetic) and self._phonetic[i] == key:
+            return [self.names[j] for j in _ids(self._phonetic_ids[i])]
+        return []
+
+    def lookup(self, text):
+        """
+        Returns the names that are the same as text when folded, e.g.
+        'kärkkäinen, matti' for 'Karkkainen Matti' or 'Matti Karkkainen'
+        """
+        return self.spoken(fold(text))[0]
+
+    def spoken(self, form):
+        """
+        Looks up a spoken form of a name, i.e. a node of the token trie.
+        :param form: folded words separated by single spaces
+        :return: a tuple of the names with exactly this spoken form and
+        whether longer spoken forms continue with these words
+        """
+        i = bisect_left(self._spoken, form)
+
+        names = []
+        if i < len(self._spoken) and self._spoken[i] == form:
+            names = [self.names[j] for j in _ids(self._spoken_ids[i])]
+            i += 1
+
+        # No character sorts before the space in the names, so a longer
+        # form with the same words would be the very next one
+        longer = i < len(self._spoken) and \
+            self._spoken[i].startswith(form + ' ')
+        return names, longer
+
+    def close(self):
+        self._mmap.close()
+
+
+def _ids(b):
+    """ Unpacks a list of little-endian uint32 ids """
+    a = array('I')
+    a.frombytes(b)
+    if sys.byteorder == 'big':  # pragma: no cover
+        a.byteswap()
+    return a
+
+
+def _pack_ids(ids):
+    """ Packs a list of ids as little-endian uint32 """
+    a = ids if isinstance(ids, array) else array('I', ids)
+    if sys.byteorder == 'big':  # pragma: no cover
+        a = array('I', a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def fold(text):
+    """
+    Folds a name or a transcript to the form used for matching: lowercase,
+    without diacritics and with punctuation turned into spaces, e.g.
+    '2000.hel.fi, Euroopan kulttuurikaupunki' ->
+    '2000 hel fi euroopan kulttuurikaupunki' and 'Kärkkäinen' -> 'karkkainen'
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(_punctuation.sub(' ', text).split())
+
+
+def phonetic_key(text):
+    """
+    Returns a phonetic key of a name, so that names that sound alike get the
+    same key. The key is a simplified Metaphone that also suits Finnish
+    names: diacritics are dropped, double letters are collapsed (Finnish
+    long sounds), voiced and unvoiced stops are merged, v and w are the same
+    and only the leading vowel of a word is kept. The words of the name
+    keep their order, e.g. 'vogel, steven' -> 'fkl stfn'.
+    """
+    keys = []
+    for word in fold(text).split():
+        for pattern, repl in _PHONETIC_RULES:
+            word = pattern.sub(repl, word)
+        if word:
+            keys.append(word)
+    return ' '.join(keys)
+
+
+def spoken_forms(name):
+    """
+    Returns the ways a name can be said: its folded words, and if it is
+    written as 'last, first', also the first name first.
+    E.g. 'vogel, steven' -> ['vogel steven', 'steven vogel']
+    """
+    forms = [fold(name)]
+
+    if ',' in name:
+        last, first = map(fold, name.split(',', 1))
+        if last and first:
+            forms.append(first + ' ' + last)
+
+    return [form for form in forms if form]
+
+
+def trigrams(s):
+    """
+    Returns the character trigrams of s as index keys. A trigram that occurs
+    many times in s gets a different key for every occurrence (e.g. 'dod'
+    and 'dod1' in 'dodo, dodo'), so shared keys count shared trigrams
+    with multiplicity.
+    """
+    seen = Counter()
+    keys = []
+    for i in range(0, len(s) - 2):
+        gram = s[i:i+3]
+        keys.append(gram + str(seen[gram]) if seen[gram] else gram)
+        seen[gram] += 1
+    return keys
+
+
+def _source_stamp(fname):
+    """
+    Returns the size and the crc32 of a file, used for finding out if an
+    index is up to date with its source
+    """
+    crc = 0
+    size = 0
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return size, crc
+
+
+def read_names(fname):
+    """
+    Reads the author names from a text file with one name per line.
+    Empty lines and duplicates are dropped and the names are sorted, so the
+    order of the file does not matter.
+    """
+    with open(fname, 'r', encoding='utf-8') as f:
+        names = set(line.strip() for line in f)
+    names.discard('')
+    return sorted(names)
+
+
+def _write_array(f, items):
+    """ Writes a list of byte strings as an offsets table and a blob """
+    offset = 0
+    table = [offset]
+    for item in items:
+        offset += len(item)
+        table.append(offset)
+
+    f.write(struct.pack('<%dI' % len(table), *table))
+    for item in items:
+        f.write(item)
+
+
+def build(fname, dst):
+    """
+    Builds the binary index of a text file of author names.
+    :param fname: the text file, one name per line
+    :param dst: where the index is written
+    :return: path of the written index
+    """
+    names = read_names(fname)
+    size, crc = _source_stamp(fname)
+
+    # The ids are collected in compact arrays, so that large author lists
+    # can be indexed on a small build box
+    longest = max(map(len, names), default=0)
+    lengths = [array('I') for _ in range(0, longest + 1)]
+    postings = defaultdict(lambda: array('I'))
+    for i, name in enumerate(names):
+        lengths[len(name)].append(i)
+        for gram in trigrams(name):
+            postings[gram.encode('utf-8')].append(i)
+    grams = sorted(postings)
+
+    buckets = defaultdict(lambda: array('I'))
+    for i, name in enumerate(names):
+        buckets[phonetic_key(name).encode('ascii')].append(i)
+    buckets.pop(b'', None)
+    keys = sorted(buckets)
+
+    spoken = defaultdict(lambda: array('I'))
+    for i, name in enumerate(names):
+        for form in spoken_forms(name):
+            spoken[form].append(i)
+    forms = sorted(spoken)
+
+    sections = [
+        ('names', [name.encode('utf-8') for name in names]),
+        ('lengths', [_pack_ids(ids) for ids in lengths]),
+        ('grams', grams),
+        ('postings', [_pack_ids(postings[gram]) for gram in grams]),
+        ('phonetic', keys),
+        ('phonetic_ids', [_pack_ids(buckets[key]) for key in keys]),
+        ('spoken', [form.encode('utf-8') for form in forms]),
+        ('spoken_ids', [_pack_ids(spoken[form]) for form in forms]),
+    ]
+
+    # The file is written next to the destination first and then renamed, so
+    # other processes never see a half-written index
+    tmp = dst + '.' + str(os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, size, crc, len(sections)))
+
+        offset = _HEADER.size + _SECTION.size * len(sections)
+        for name, items in sections:
+            f.write(_SECTION.pack(name.encode('ascii'), offset, len(items)))
+            offset += _OFFSET.size * (len(items) + 1) + sum(map(len, items))
+
+        for name, items in sections:
+            _write_array(f, items)
+
+    os.replace(tmp, dst)
+    return dst
+
+
+def _is_current(path, stamp):
+    """ Checks that the index in path exists and was built from stamp """
+    try:
+        with open(path, 'rb') as f:
+            magic, version, size, crc, _ = \
+                _HEADER.unpack(f.read(_HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return magic == _MAGIC and version == _VERSION and (size, crc) == stamp
+
+
+def index_path(fname):
+    """
+    Returns the path of an up to date index for fname, building one in the
+    temp directory if the index next to fname is missing or stale.
+    """
+    stamp = _source_stamp(fname)
+
+    prebuilt = fname + '.idx'
+    if _is_current(prebuilt, stamp):
+        return prebuilt
+
+    built = os.path.join(tempfile.gettempdir(), 'libby-%08x-%s.idx'
+                         % (stamp[1], os.path.basename(fname)))
+    if not _is_current(built, stamp):
+        build(fname, built)
+    return built
+
+
+def load(fname='authors_clean.txt'):
+    """
+    Returns the index of fname. The index is opened only once per container
+    and shared by every search after that.
+    """
+    index = _indexes.get(fname)
+    if index is None:
+        index = AuthorIndex(index_path(fname))
+        _indexes[fname] = index
+    return index
+
+
+if __name__ == '__main__':  # pragma: no cover
+    for src in sys.argv[1:] or ['authors_clean.txt']:
+        print(build(src, src + '.idx'))
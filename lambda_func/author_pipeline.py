@@ -0,0 +1,225 @@
+"""
+Rebuilds the author list (authors_clean.txt) and its index from harvested
+catalogue records.
+
+The records are read as JSON lines, one Finna record (or one whole Finna
+search response) per line, optionally gzipped. The author names are
+extracted and normalized, then deduplicated and sorted with an external
+merge sort: the names are sorted in chunks of bounded size that are spilled
+to temporary files and merged, so the number of names is not limited by
+memory. The sorted list is checked to be in Python string order before the
+index is built from it.
+
+    python author_pipeline.py records.jsonl.gz [more.jsonl ...] \\
+        -o authors_clean.txt
+"""
+
+import argparse
+import gzip
+import heapq
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import author_index
+
+
+# The record fields that list authors
+_author_fields = ['nonPresenterAuthors', 'primaryAuthors', 'secondaryAuthors',
+                  'corporateAuthors']
+
+
+def _open(path):
+    """ Opens a file of records for reading, '-' is the standard input """
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def read_records(paths):
+    """
+    Reads the records from JSON lines files, one at a time
+    :param paths: the files, a line holds a record or a search response
+    """
+    for path in paths:
+        with _open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+
+                data = json.loads(line)
+                if 'records' in data:
+                    for record in data['records']:
+                        yield record
+                else:
+                    yield data
+
+
+def normalize(name):
+    """
+    Normalizes an author name the way they are stored in the author list:
+    lowercase without trailing whitespace. Otherwise the spelling of the
+    catalogue is kept, commas, full stops and double spaces included,
+    because the names are compared to those of the records as they are,
+    see book_info.author_titles. E.g. 'Aaker, David A. ' -> 'aaker, david a.'
+    """
+    return name.lower().rstrip()
+
+
+def extract_names(records):
+    """ Yields the normalized author names of the records """
+    for record in records:
+        for field in _author_fields:
+            authors = record.get(field) or []
+
+            # Newer API versions group the authors by their role
+            if isinstance(authors, dict):
+                authors = [a for group in authors.values() for a in group]
+
+            for author in authors:
+                if isinstance(author, dict):
+                    author = author.get('name')
+                if author:
+                    name = normalize(author)
+                    if name:
+                        yield name
+
+
+def _spill(names, tmpdir):
+    """ Writes a sorted chunk of names to a temporary run file """
+    fd, path = tempfile.mkstemp(suffix='.run', dir=tmpdir)
+    with io.open(fd, 'w', encoding='utf-8') as f:
+        for name in sorted(names):
+            f.write(name + '\n')
+    return path
+
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line[:-1]
+
+
+def external_sort(names, chunk_size=200000, tmpdir=None):
+    """
+    Sorts and deduplicates names with bounded memory. At most chunk_size
+    distinct names are held in memory at a time, the rest are spilled to
+    sorted run files that are merged at the end.
+    :param names: iterable of names, in any order
+    :param chunk_size: how many names are sorted in memory at a time
+    :param tmpdir: where the run files are written
+    :return: generator of the distinct names in sorted order
+    """
+    tmpdir = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        runs = []
+        chunk = set()
+        for name in names:
+            chunk.add(name)
+            if len(chunk) >= chunk_size:
+                runs.append(_spill(chunk, tmpdir))
+                chunk = set()
+
+        merged = heapq.merge(sorted(chunk),
+                             *[_read_run(path) for path in runs])
+
+        previous = None
+        for name in merged:
+            if name != previous:
+                yield name
+                previous = name
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def write_sorted(names, dst):
+    """
+    Writes names to a text file, one per line, checking that they are
+    distinct and sorted
+    :return: how many names were written
+    """
+    tmp = dst + '.' + str(os.getpid())
+    count = 0
+    previous = None
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for name in names:
+                if previous is not None and not previous < name:
+                    raise ValueError('Names are not sorted: %r after %r'
+                                     % (name, previous))
+                f.write(name + '\n')
+                previous = name
+                count += 1
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return count
+
+
+def check_sorted(fname):
+    """
+    Checks that a text file of names is strictly sorted in Python string
+    order, which the searches rely on
+    :return: how many names the file has
+    :raises ValueError: with the line number of the first name out of order
+    """
+    count = 0
+    previous = None
+    with open(fname, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            name = line.rstrip('\n')
+            if not name:
+                continue
+            if previous is not None and not previous < name:
+                raise ValueError('%s:%d: %r is not after %r'
+                                 % (fname, number, name, previous))
+            previous = name
+            count += 1
+    return count
+
+
+def rebuild(paths, dst, chunk_size=200000, index=True):
+    """
+    Rebuilds the author list and its index from records
+    :param paths: JSON lines files of records
+    :param dst: the author list that is written
+    :param chunk_size: how many names are sorted in memory at a time
+    :param index: whether the index is built too
+    :return: how many names the list has
+    """
+    names = external_sort(extract_names(read_records(paths)), chunk_size,
+                          os.path.dirname(os.path.abspath(dst)))
+    count = write_sorted(names, dst)
+    check_sorted(dst)
+
+    if index:
+        author_index.build(dst, dst + '.idx')
+    return count
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description='Rebuild the author list')
+    parser.add_argument('records', nargs='+',
+                        help='JSON lines files of records, - for stdin')
+    parser.add_argument('-o', '--output', default='authors_clean.txt',
+                        help='the author list that is written')
+    parser.add_argument('--chunk-size', type=int, default=200000,
+                        help='how many names are sorted in memory at a time')
+    parser.add_argument('--no-index', action='store_true',
+                        help='do not build the index')
+    args = parser.parse_args()
+
+    count = rebuild(args.records, args.output, args.chunk_size,
+                    not args.no_index)
+    print('%d authors written to %s' % (count, args.output))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -1,4 +1,37 @@
-from difflib import get_close_matches
+from bisect import bisect_left
+from collections import namedtuple
+from difflib import SequenceMatcher
+import heapq
+import os
+import re
+import time
+import author_index
+import cache
+
+
+# An author name spotted in a sentence, start and end are the character
+# positions of the mention in the sentence
+Match = namedtuple('Match', ['name', 'start', 'end'])
+
+# A ranked author candidate, score is 1.0 for names mentioned exactly and
+# the similarity ratio for names close to or sounding like the words
+Candidate = namedtuple('Candidate', ['name', 'score'])
+
+# The words of a sentence, as they are matched to spoken forms of names
+_word = re.compile(r'\S+')
+
+
+# How similar a name that sounds like the searched words must be to them,
+# so that single common words do not match short names by accident
+_phonetic_cutoff = 0.8
+
+# Results of the searches by search mode and sentence. The same authors and
+# phrasings come up again and again, and not finding an author is the most
+# expensive search, so the misses are cached too
+_cache = cache.LRUCache(int(os.getenv('AUTHOR_CACHE_SIZE', '1024')))
+
+# Tells a cached None apart from nothing cached
+_missing = object()
 
 
 def load_file(fname):
@@ -17,24 +50,41 @@ def load_file(fname):
 
 def binary_search(l, name):
     """
-    Search the name from the list recursively. Return
+    Search the name from a sorted list (or an author index). Return
     true if the name was found, false otherwise
     """
+    i = bisect_left(l, name)
+    return i < len(l) and l[i] == name
 
-    half = int(len(l)/2)
 
-    if half == 0:
-        if l[half] == name:
-            return True
-        else:
-            return False
+def _normalize(sentence):
+    """ Lowercase the sentence and separate its words by single spaces """
+    return ' '.join(sentence.lower().split())
 
-    if l[half] > name:
-        return binary_search(l[:half], name)
-    elif l[half] < name:
-        return binary_search(l[half:], name)
-    elif l[half] == name:
-        return True
+
+def _cached(mode, sentence, fname, find):
+    """
+    Returns the result of find(sentence, fname) from the cache, or searches
+    it and caches it
+    :param mode: name of the search mode, part of the cache key
+    :param find: the search function
+    """
+    sentence = _normalize(sentence)
+    key = (mode, sentence, fname)
+
+    name = _cache.get(key, _missing)
+    if name is _missing:
+        name = find(sentence, fname)
+        _cache.put(key, name)
+
+    return name
+
+
+def cache_stats():
+    """
+    :return: hits, misses, evictions and size of the search cache
+    """
+    return _cache.stats()
 
 
 def generate_search_terms(sentence):
@@ -60,20 +110,181 @@ def generate_search_terms(sentence):
     return l + ll
 
 
+def spot_all(sentence, fname='authors_clean.txt'):
+    """
+    Find every mention of an author in a sentence, of any number of words,
+    in a single pass over the words of the sentence. The spoken forms of
+    the names are walked as a token trie from every word onwards.
+    :param sentence: the sentence where you wish to find names
+    :return: list of Match tuples, in the order they start
+    """
+
+    l = author_index.load(fname)
+
+    # The words are folded like the spoken forms, so that a word can split
+    # into many, e.g. '2000.hel.fi' -> '2000 hel fi'
+    words = []
+    for m in _word.finditer(sentence):
+        for word in author_index.fold(m.group()).split():
+            words.append((word, m.start(), m.end()))
+
+    matches = []
+    for i in range(0, len(words)):
+        form = words[i][0]
+        for j in range(i, len(words)):
+            if j > i:
+                form += ' ' + words[j][0]
+            names, longer = l.spoken(form)
+            if names:
+                matches.append(Match(names[0], words[i][1], words[j][2]))
+            if not longer:
+                break
+
+    return matches
+
+
+class IncrementalMatcher(object):
+    """
+    Spots author names in a sentence that is heard a word at a time, e.g.
+    from the partial hypotheses of a speech recognizer, so that the author
+    can be resolved while the user is still speaking.
+
+    The matcher keeps the live mentions, i.e. the spoken forms that the
+    words heard last may still grow into, and extends them with every new
+    word. Each node of the trie is looked up only once, and a revised
+    hypothesis only costs the words after the part that stayed the same.
+    The positions of the Match tuples are word positions.
+    """
+
+    def __init__(self, fname='authors_clean.txt'):
+        self._index = author_index.load(fname)
+        self._nodes = {}
+
+        # The words fed, the folded words and the state after each of them
+        self._words = []
+        self._tokens = []
+        self._history = []
+
+        self._live = []
+        self.matches = []
+
+    def _node(self, form):
+        node = self._nodes.get(form)
+        if node is None:
+            node = self._index.spoken(form)
+            self._nodes[form] = node
+        return node
+
+    def feed(self, word):
+        """
+        Extends the live mentions with the next word
+        :param word: a word as it was heard
+        :return: the matches completed by this word
+        """
+        self._history.append((self._live, len(self.matches),
+                              len(self._tokens)))
+        self._words.append(word)
+
+        new = []
+        for token in author_index.fold(word).split():
+            live = []
+            pos = len(self._tokens)
+            self._tokens.append(token)
+
+            for start, form in self._live + [(pos, '')]:
+                form = form + ' ' + token if form else token
+                names, longer = self._node(form)
+                if names:
+                    new.append(Match(names[0], start, pos + 1))
+                if longer:
+                    live.append((start, form))
+
+            self._live = live
+
+        self.matches.extend(new)
+        return new
+
+    def rewind(self, n):
+        """ Forgets everything after the first n words """
+        while len(self._words) > n:
+            self._words.pop()
+            self._live, matches, tokens = self._history.pop()
+            del self.matches[matches:]
+            del self._tokens[tokens:]
+
+    def update(self, hypothesis):
+        """
+        Updates the matcher with the latest hypothesis of the whole sentence.
+        Words that did not change since the last hypothesis are not matched
+        again.
+        :return: the matches completed by the new words
+        """
+        words = hypothesis.split()
+
+        same = 0
+        for old, word in zip(self._words, words):
+            if old != word:
+                break
+            same += 1
+
+        self.rewind(same)
+
+        new = []
+        for word in words[same:]:
+            new.extend(self.feed(word))
+        return new
+
+    def live(self):
+        """
+        :return: the spoken forms of names that the last words may still
+        grow into, e.g. ['vogel'] after hearing 'books by vogel'
+        """
+        return [form for _, form in self._live]
+
+    def best(self):
+        """
+        :return: the longest complete mention this far, or None
+        """
+        best = None
+        for match in self.matches:
+            if best is None or match.end - match.start > best.end - best.start:
+                best = match
+        return best
+
+
+def spot(sentence, fname='authors_clean.txt', after=0, words=1):
+    """
+    Find the longest mention of an author in a sentence (the first one
+    if there are many as long).
+    :param sentence: the sentence where you wish to find a name
+    :param after: only mentions starting at this character or later count
+    :param words: only mentions of at least this many words count
+    :return: a Match tuple, or None if no author was mentioned
+    """
+
+    best = None
+    for match in spot_all(sentence, fname):
+        if match.start < after or \
+                len(sentence[match.start:match.end].split()) < words:
+            continue
+        if best is None or match.end - match.start > best.end - best.start:
+            best = match
+
+    return best
+
+
 def search_normal(sentence, fname='authors_clean.txt'):
     """
     Search through authors based on a sentence to see
     if the sentence contains an author's name (case ignored)
     """
+    return _cached('normal', sentence, fname, _search_normal)
 
-    terms = generate_search_terms(sentence.lower())
-    l = load_file(fname)
 
-    for word in terms:
-        ret = binary_search(l, word)
-
-        if ret:
-            return word
+def _search_normal(sentence, fname):
+    match = spot(sentence, fname)
+    if match:
+        return match.name
 
     return None
 
@@ -83,18 +294,52 @@ def search_closest(sentence, fname='authors_clean.txt'):
     Search through authors based on a sentence to see
     if the sentence contains an author's name (case ignored)
     """
+    return _cached('closest', sentence, fname, _search_closest)
+
 
+def _search_closest(sentence, fname):
     terms = generate_search_terms(sentence.lower())
-    l = load_file(fname)
+    l = author_index.load(fname)
 
     for word in terms:
-        matches = get_close_matches(word, l, 1, 0.9)
+        matches = l.close_matches(word, 1, 0.9)
         if len(matches) > 0:
             return matches[0]
 
     return None
 
 
+def search_phonetic(sentence, fname='authors_clean.txt'):
+    """
+    Search through authors based on a sentence to see
+    if the sentence contains a name that sounds like an author's name,
+    e.g. a name misheard by the speech recognition (case ignored)
+    """
+    return _cached('phonetic', sentence, fname, _search_phonetic)
+
+
+def _search_phonetic(sentence, fname):
+    terms = generate_search_terms(sentence.lower())
+    l = author_index.load(fname)
+
+    for word in terms:
+        best = None
+        best_ratio = _phonetic_cutoff
+
+        # The bucket of names sounding alike is small, so the names in it
+        # can be ranked by how close they are to the words that were heard
+        for name in l.sounds_like(word):
+            ratio = SequenceMatcher(None, word, name).ratio()
+            if ratio >= best_ratio:
+                best = name
+                best_ratio = ratio
+
+        if best:
+            return best
+
+    return None
+
+
 def search(sentence, search_closest=True, fname='authors_clean.txt'):
     """
     Search through authors based on a sentence to see
@@ -103,22 +348,88 @@ def search(sentence, search_closest=True, fname='authors_clean.txt'):
     :param search_closest: whether you want to also find the closest one
     if the exact name was not found
     """
+    if search_closest:
+        return _cached('search', sentence, fname, _search_with_closest)
+    return _cached('normal', sentence, fname, _search_normal)
 
-    terms = generate_search_terms(sentence.lower())
-    l = load_file(fname)
 
-    for word in terms:
-        res = binary_search(l, word)
-        if res:
-            return word
+def _search_with_closest(sentence, fname):
+    match = spot(sentence, fname)
+    if match:
+        return match.name
 
     # no exact match was found
-    if search_closest:
-        for word in terms:
-            matches = get_close_matches(word, l, 1, 0.9)
+    return _search_closest(sentence, fname)
 
-            if len(matches) > 0:
-                return matches[0]
 
-    return None
+def search_topk(sentence, k=3, fname='authors_clean.txt', budget=0.2,
+                cutoff=0.85):
+    """
+    Search through authors based on a sentence and rank every author that
+    could be meant: the names mentioned exactly, the names that sound like
+    the words and the names close to the words.
+    :param sentence: the sentence where you wish to find names
+    :param k: how many candidates are returned at most
+    :param budget: seconds that may be spent on searching close matches,
+    the exact and phonetic matches are always searched
+    :param cutoff: how similar close matches must be to the words
+    :return: list of at most k Candidate tuples, best first
+    """
+    sentence = _normalize(sentence)
+    key = ('topk', k, cutoff, sentence, fname)
+
+    candidates = _cache.get(key, _missing)
+    if candidates is _missing:
+        candidates, complete = _search_topk(sentence, k, fname, budget,
+                                            cutoff)
+        # What was found before the time ran out depends on the timing, so
+        # only the complete results are cached
+        if complete:
+            _cache.put(key, candidates)
+
+    return candidates
+
+
+def _search_topk(sentence, k, fname, budget, cutoff):
+    """
+    :return: the candidates, and whether all the words were searched in
+    time
+    """
+    deadline = time.time() + budget
+    complete = True
+    l = author_index.load(fname)
+    terms = generate_search_terms(sentence.lower())
+
+    # Best score of every name found, so that a name found in many ways
+    # is ranked only once
+    scores = {}
+
+    def add(name, score):
+        if score > scores.get(name, 0):
+            scores[name] = score
 
+    # A longer mention is a better guess than the shorter ones inside it
+    matches = spot_all(sentence, fname)
+    longest = max([match.end - match.start for match in matches] or [0])
+    for match in matches:
+        add(match.name, 1.0 if match.end - match.start == longest else 0.99)
+
+    # Sounding the same is more telling than being close in writing, so
+    # these are ranked above the close matches of the same similarity
+    for word in terms:
+        for name in l.sounds_like(word):
+            ratio = SequenceMatcher(None, word, name).ratio()
+            if ratio >= _phonetic_cutoff:
+                add(name, min((1 + ratio) / 2, 0.98))
+
+    # Searching close matches is the slow part, so it stops when the time
+    # is up and the best candidates this far are returned
+    for word in terms:
+        if time.time() > deadline:
+            complete = False
+            break
+        for ratio, name in l.scored_matches(word, k, cutoff):
+            add(name, ratio)
+
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [Candidate(name, score) for name, score in best], complete
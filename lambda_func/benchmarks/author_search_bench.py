@@ -0,0 +1,218 @@
+"""
+Benchmarks of the author searches against the real author list.
+
+The transcripts are the user lines of sample_transcript.txt and author
+questions made of the utterances in author_utterances.txt and names from the
+author list, both as they are and misheard (one letter changed). Every
+search is run with an empty search cache, so the numbers are the cost of
+actually searching.
+
+Run it in the lambda_func folder:
+
+    python benchmarks/author_search_bench.py            # print the results
+    python benchmarks/author_search_bench.py --save     # write the baseline
+    python benchmarks/author_search_bench.py --compare  # check for regressions
+
+--compare exits with 1 if the p95 latency of any search mode is more than
+--tolerance times the baseline.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_lambda_dir = os.path.dirname(_here)
+_root_dir = os.path.dirname(_lambda_dir)
+
+sys.path.insert(0, _lambda_dir)
+
+import author_index  # noqa: E402
+import author_search as AS  # noqa: E402
+
+
+_authors = os.path.join(_lambda_dir, 'authors_clean.txt')
+_utterances = os.path.join(_lambda_dir, 'author_utterances.txt')
+_transcript = os.path.join(_root_dir, 'sample_transcript.txt')
+_baseline = os.path.join(_here, 'author_search_baseline.json')
+
+# The search modes that are measured
+_modes = {
+    'search': lambda s, f: AS.search(s, True, f),
+    'search_normal': AS.search_normal,
+    'search_closest': AS.search_closest,
+}
+
+# Run in a new interpreter to measure the first search of a cold container
+_cold_script = """
+import sys, time
+sys.path.insert(0, {lambda_dir!r})
+start = time.time()
+import author_search as AS
+AS.search({sentence!r}, True, {fname!r})
+print((time.time() - start) * 1000)
+"""
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of a list of numbers """
+    values = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def _mishear(name, rnd):
+    """ Changes one letter of a name, like a speech recognizer might """
+    letters = [i for i, c in enumerate(name) if c.isalpha()]
+    if not letters:
+        return name
+    i = rnd.choice(letters)
+    return name[:i] + rnd.choice('aeiouklmnrst') + name[i + 1:]
+
+
+def make_transcripts(fname=_authors, count=100, seed=0):
+    """
+    Makes the transcripts that are searched
+    :param fname: the author list the names are picked from
+    :param count: how many author questions are made
+    :param seed: seed of the random choices, so the runs are comparable
+    """
+    rnd = random.Random(seed)
+    index = author_index.load(fname)
+
+    with open(_transcript, 'r') as f:
+        transcripts = [line.strip() for line in f
+                       if line.strip() and not line.startswith('-')]
+
+    with open(_utterances, 'r') as f:
+        utterances = [line.strip() for line in f if line.strip()]
+
+    for i in range(0, count):
+        name = index[rnd.randrange(len(index))]
+        spoken = rnd.choice(author_index.spoken_forms(name))
+        if i % 2:
+            spoken = _mishear(spoken, rnd)
+        transcripts.append(rnd.choice(utterances) + ' ' + spoken)
+
+    return transcripts
+
+
+def _cold_start(fname, sentence, runs):
+    """ Milliseconds to import author_search and search once, per run """
+    script = _cold_script.format(lambda_dir=_lambda_dir, sentence=sentence,
+                                 fname=fname)
+    times = []
+    for _ in range(0, runs):
+        out = subprocess.check_output([sys.executable, '-c', script],
+                                      cwd=_lambda_dir)
+        times.append(float(out.decode().strip().splitlines()[-1]))
+    return times
+
+
+def run(fname=_authors, count=100, cold_runs=5, seed=0):
+    """
+    Runs the benchmark
+    :return: the results as a dictionary
+    """
+    transcripts = make_transcripts(fname, count, seed)
+
+    # Opening the index is part of the cold start, not of the searches
+    author_index.load(fname)
+
+    modes = {}
+    for mode, search in sorted(_modes.items()):
+        times = []
+        for sentence in transcripts:
+            AS._cache.clear()
+            start = time.time()
+            search(sentence, fname)
+            times.append((time.time() - start) * 1000)
+
+        modes[mode] = {
+            'p50_ms': round(percentile(times, 50), 3),
+            'p95_ms': round(percentile(times, 95), 3),
+            'p99_ms': round(percentile(times, 99), 3),
+            'max_ms': round(max(times), 3),
+        }
+
+    # Tracing the allocations slows the searches down a lot, so the peak
+    # memory is measured separately from the latencies, with fewer searches
+    tracemalloc.start()
+    for mode, search in sorted(_modes.items()):
+        for sentence in transcripts[::max(1, len(transcripts) // 20)]:
+            AS._cache.clear()
+            search(sentence, fname)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cold = _cold_start(fname, transcripts[-1], cold_runs) if cold_runs else []
+
+    return {
+        'python': platform.python_version(),
+        'authors': len(author_index.load(fname)),
+        'transcripts': len(transcripts),
+        'modes': modes,
+        'cold_ms': round(percentile(cold, 50), 3) if cold else None,
+        'warm_ms': modes['search']['p50_ms'],
+        'peak_alloc_kb': peak // 1024,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """
+    Compares the p95 latencies of a run to the baseline
+    :return: list of messages about the modes that got slower
+    """
+    slower = []
+    for mode, numbers in sorted(result['modes'].items()):
+        old = baseline['modes'].get(mode)
+        if old and numbers['p95_ms'] > old['p95_ms'] * tolerance:
+            slower.append('%s: p95 %.3f ms, baseline %.3f ms'
+                          % (mode, numbers['p95_ms'], old['p95_ms']))
+    return slower
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description='Benchmark author search')
+    parser.add_argument('--count', type=int, default=100,
+                        help='how many author questions are searched')
+    parser.add_argument('--cold-runs', type=int, default=5,
+                        help='how many cold starts are measured')
+    parser.add_argument('--baseline', default=_baseline,
+                        help='the baseline file')
+    parser.add_argument('--save', action='store_true',
+                        help='write the results as the new baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare the results to the baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='how many times slower than the baseline is ok')
+    args = parser.parse_args()
+
+    result = run(count=args.count, cold_runs=args.cold_runs)
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            slower = compare(result, json.load(f), args.tolerance)
+        for message in slower:
+            print('SLOWER ' + message)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
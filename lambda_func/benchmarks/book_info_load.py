@@ -0,0 +1,173 @@
+"""
+Load test of the book intents (FindBook, ExtraInfo and Author) end to end,
+without the network.
+
+The events are the ones of tests/book_info_test.json. Their Finna requests
+are recorded once from the real API, and then replayed from the fixture
+file with a configurable latency, as many times and by as many threads as
+wanted. The response cache of finna is turned off, so every turn sends its
+requests, unless --cache is given. The books of the previous turn are
+then not remembered for the follow-up questions either, see conversation.
+
+Run it in the lambda_func folder:
+
+    python benchmarks/book_info_load.py --record      # needs api.finna.fi
+    python benchmarks/book_info_load.py --rounds 20 --threads 4 \\
+        --latency 0.08 --jitter 0.05
+
+The run exits with 1 if any request was not found in the fixtures.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_lambda_dir = os.path.dirname(_here)
+
+sys.path.insert(0, _lambda_dir)
+sys.path.insert(0, _here)
+
+import conversation  # noqa: E402
+import finna  # noqa: E402
+import main_handler  # noqa: E402
+import replay  # noqa: E402
+import resilience  # noqa: E402
+from author_search_bench import percentile  # noqa: E402
+from cache import LRUCache  # noqa: E402
+
+
+_events = os.path.join(_lambda_dir, 'tests', 'book_info_test.json')
+_fixtures = os.path.join(_here, 'finna_fixtures.jsonl.gz')
+
+# The intents that are measured
+_intents = ['FindBook', 'ExtraInfo', 'Author']
+
+
+def load_events(fname=_events):
+    """ :return: list of (name, event) of the book intents """
+    with open(fname, 'r') as f:
+        events = json.load(f)
+    return [(name, event) for name, event in sorted(events.items())
+            if event['currentIntent']['name'] in _intents]
+
+
+def _turn(event):
+    """ :return: milliseconds the handler took to answer the event """
+    start = time.time()
+    main_handler.lambda_handler(event, None)
+    return (time.time() - start) * 1000
+
+
+def record(events, fname=_fixtures):
+    """
+    Runs every event once against the real API and saves the requests
+    :return: how many requests were recorded
+    """
+    transport = replay.RecordingTransport(finna.get_transport())
+    previous = finna.set_transport(transport)
+    ttl, results = finna._ttl, conversation._results
+    finna._ttl = {}
+    conversation._results = LRUCache(0)
+    try:
+        for _, event in events:
+            main_handler.lambda_handler(event, None)
+    finally:
+        finna.set_transport(previous)
+        finna._ttl, conversation._results = ttl, results
+    transport.save(fname)
+    return len(transport.store)
+
+
+def run(events, store, rounds=10, threads=1, latency=0.0, jitter=0.0,
+        cache=False, seed=0):
+    """
+    Replays the events
+    :param events: list of (name, event)
+    :param store: the fixtures, see replay.load
+    :param rounds: how many times every event is answered
+    :param threads: how many turns are answered at the same time
+    :param latency: seconds every Finna response takes
+    :param jitter: seconds at most added to the latency at random
+    :param cache: whether the response cache of finna and the books of the
+    conversations are used
+    :return: the results as a dictionary
+    """
+    transport = replay.ReplayTransport(store, latency, jitter, seed)
+    previous = finna.set_transport(resilience.ResilientTransport(transport))
+    ttl, results = finna._ttl, conversation._results
+    if not cache:
+        finna._ttl = {}
+        conversation._results = LRUCache(0)
+
+    turns = [event for _ in range(0, rounds) for _, event in events]
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(threads) as executor:
+            times = list(executor.map(_turn, turns))
+    finally:
+        finna.set_transport(previous)
+        finna._ttl, conversation._results = ttl, results
+    elapsed = time.time() - start
+
+    intents = {}
+    for event, ms in zip(turns, times):
+        intents.setdefault(event['currentIntent']['name'], []).append(ms)
+
+    return {
+        'turns': len(turns),
+        'turns_per_s': round(len(turns) / elapsed, 1) if elapsed else None,
+        'requests': transport.requests,
+        'unmatched': sorted(set(transport.unmatched)),
+        'intents': dict((name, {
+            'p50_ms': round(percentile(ms, 50), 3),
+            'p95_ms': round(percentile(ms, 95), 3),
+            'max_ms': round(max(ms), 3),
+        }) for name, ms in sorted(intents.items())),
+    }
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description='Load test book intents')
+    parser.add_argument('--fixtures', default=_fixtures,
+                        help='the fixture file')
+    parser.add_argument('--record', action='store_true',
+                        help='record the fixtures from the real API')
+    parser.add_argument('--rounds', type=int, default=10,
+                        help='how many times every event is answered')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='how many turns are answered at the same time')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds every Finna response takes')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='seconds at most added to the latency')
+    parser.add_argument('--cache', action='store_true',
+                        help='use the response cache of finna and the '
+                        'books of the conversations')
+    args = parser.parse_args()
+
+    events = load_events()
+    if args.record:
+        count = record(events, args.fixtures)
+        print('%d requests recorded to %s' % (count, args.fixtures))
+        return
+
+    if not os.path.exists(args.fixtures):
+        sys.exit('No fixtures in %s, record them with --record'
+                 % args.fixtures)
+
+    result = run(events, replay.load(args.fixtures), args.rounds,
+                 args.threads, args.latency, args.jitter, args.cache)
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+    for key in result['unmatched']:
+        print('UNMATCHED ' + key)
+    if result['unmatched']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -1,15 +1,48 @@
 import util
 import re
-from botocore.vendored import requests
+import os
+import itertools
+import finna
 import author_search as AS
-import signal
+import fanout
+import utterances
+import query
+import deadline as _deadline
+import catalogue
+import conversation
 
 
-"""This is the URL for the Finna API with a needed header for proper results"""
-__url = 'https://api.finna.fi/api/v1/'
-__headers = {'Accept': 'application/json'}
 json_dir = './api_testing/data_files/'
 
+# How many authors are considered when the author is not recognized exactly
+_author_candidates = 3
+
+# The fields and the page size each kind of search needs. parse_subject
+# reads the records only when there are less than five of them, and
+# parse_author lists the titles of a full default page.
+_subject_fields = ['id', 'shortTitle', 'buildings']
+_subject_limit = 4
+_subject_facets = ['building']
+_author_fields = ['title', 'nonPresenterAuthors']
+_author_limit = 20
+
+# The fields of the books that are fetched for the follow-up questions,
+# which filter them by the author and the year, see conversation. They are
+# only asked for after Libby has asked for an author or a year.
+_refine_fields = _subject_fields + ['year', 'nonPresenterAuthors']
+
+# How many titles of an author are named. The books of the author are
+# paged through until one more title than this is found, to know whether
+# there are others, but at most _author_pages pages are fetched.
+_author_titles = int(os.getenv('AUTHOR_TITLES', '3'))
+_author_pages = int(os.getenv('AUTHOR_PAGES', '5'))
+
+# Building facet values of the libraries, e.g. 1/AALTO/harald/
+_library = re.compile("1/AALTO/([a-z])*/")
+
+# How many libraries are named when asking to narrow down the search
+_top_libraries = 3
+
 
 """
    AWS INPUT(SEARCH TERM)---->subject_info()---->parse_subject()-->OUTPUT TO AWS
@@ -27,33 +60,123 @@ json_dir = './api_testing/data_files/'
 
 
 # Author intent use this.
-def find_info_author(intent):
+def find_info_author(intent, deadline=None):
     text = intent['inputTranscript'].lower()
-    utterances = AS.load_file('author_utterances.txt')
-    to_drop = 0
 
     # this takes utterances off if it will be found in author_utterances.txt
-    for line in utterances:
-        if text.startswith(line):
-            to_drop = len(line)
-            break
+    author_text = utterances.author.strip(text)
+
+    # this checks which authors the user may have meant
+    candidates = AS.search_topk(author_text, _author_candidates)
+    if not candidates:
+        return parse_author({}, {'author': None})
+
+    # the author was mentioned by name
+    if candidates[0].score == 1.0:
+        author = candidates[0].name
+        search = _books_of(author, deadline)
+        return parse_author(search(1), {'author': author}, search)
+
+    # otherwise pick the candidate that has written books, or ask which one
+    # was meant if many of them have. The books of the candidates are
+    # searched at the same time.
+    searches = [_books_of(candidate.name, deadline)
+                for candidate in candidates]
+    futures = [fanout.submit(search, 1) for search in searches]
+    requests = [future.result() for future in futures]
+
+    found = []
+    for candidate, request, search in zip(candidates, requests, searches):
+        if books_written_by(request, candidate.name):
+            found.append((candidate.name, request, search))
+
+    if len(found) == 1:
+        author, request, search = found[0]
+        return parse_author(request, {'author': author}, search)
+    if len(found) > 1:
+        authors = [author for author, _, _ in found]
+        message = "Did you mean " + ", ".join(authors[:-1]) + " or " + \
+                  authors[-1] + "?"
+        return util.elicit_intent({}, message)
 
-    author_text = text[to_drop:].strip()
+    return parse_author(requests[0], {'author': candidates[0].name})
 
-    # this checks if author exists
-    author = AS.search(author_text, False)
-    request = lookfor(term=author)['json']
 
-    return parse_author(request, {'author': author})
+def _books_of(author, deadline=None):
+    """
+    :return: function that fetches a page of the search of the books of the
+    author by its number
+    """
+    def search(page):
+        # the local mirror knows the books of the author by the name
+        if catalogue.enabled():
+            data = catalogue.search(filter=['author:"' + author + '"'],
+                                    field=_author_fields, limit=_author_limit,
+                                    page=page)
+            if data is not None:
+                return data
+        return lookfor(term=author, field=_author_fields, limit=_author_limit,
+                       page=page, deadline=deadline)['json']
+    return search
+
+
+def author_titles(author, request, search=None):
+    """
+    Yields the distinct titles of the books that the author has written.
+    The next page of the search is fetched only when more titles are
+    needed, so stop iterating when there are enough of them.
+    :param author: name of the author, in lowercase
+    :param request: JSON data of the first page from the Finna API
+    :param search: function that fetches a page of the same search by its
+    number, without it only the first page is read
+    """
+    seen = set()
+    fetched = 0
+    page = 1
+    while True:
+        records = request.get('records', [])
+        for record in records:
+            authors = record.get('nonPresenterAuthors') or []
+            if any(a.get('name').lower() == author for a in authors):
+                title = record.get('title')
+                if title and title not in seen:
+                    seen.add(title)
+                    yield title
+
+        fetched += len(records)
+        if search is None or not records or page >= _author_pages or \
+                fetched >= request.get('resultCount', 0):
+            return
+
+        page += 1
+        try:
+            request = search(page)
+        except _deadline.DeadlineExceeded:
+            # answer with the titles found so far if there is no time left
+            if seen:
+                return
+            raise
+
+
+def books_written_by(request, author):
+    """
+    Finds the titles of the books in the request that the author has written
+    :param request: JSON data from the Finna API
+    :param author: name of the author, in lowercase
+    :return: list of distinct titles in the order they were found
+    """
+    return list(author_titles(author, request))
 
 
 # parse_author find author's books
-def parse_author(request, session_attributes):
+def parse_author(request, session_attributes, search=None):
     """
     :param request: JSON data from the Finna API
     :param author: Author term of the current session
     :param session_attributes: session attributes for current session if user
     has given some
+    :param search: function that fetches more pages of the search by their
+    number, if the first page does not have enough titles
     :return: Response to AWS server in JSON format
     """
 
@@ -65,34 +188,20 @@ def parse_author(request, session_attributes):
 
     result_count = request['resultCount']
 
-    # find all titles if title does not already exist in list. And sort them.
-    real_count = 0
-    books_written_by = []
-
-    for record in request['records']:
-        authors = record.get('nonPresenterAuthors')
-        has_written = False
-        if authors:
-            for a in authors:
-                if a.get('name').lower() == author:
-                    has_written = True
-                    break
-            if has_written:
-                title = record.get('title')
-                if title:
-                    if title not in books_written_by:
-                        books_written_by.append(title)
-                        real_count += 1
+    # find enough titles to answer, and one more to know if there are others
+    books = list(itertools.islice(author_titles(author, request, search),
+                                  _author_titles + 1))
+
     # if books list is empty
-    if not len(books_written_by):
+    if not len(books):
         message = "I'm sorry, I didn't found any books written ny " + author
         return util.elicit_intent({}, message)
 
     # answer will be at most three books
-    find = sorted(books_written_by)
+    find = sorted(books)
     print(str(find))
-    if len(find) > 3:
-        find = find[:3]
+    if len(find) > _author_titles:
+        find = find[:_author_titles]
         find.append("others")
 
     # only one book was found
@@ -127,27 +236,114 @@ def locate_book(info):
     return output + util.make_string_list(ret)
 
 
-def find_info(book_id, field='buildings'):
+def find_info(book_id, field='buildings', found=None, deadline=None):
     """
     Finds info from some book defined by book_id and constructs an output
     message. Default information searched is the building(and only
     information which can be searched atm).
     :param book_id: Id of the book
     :param field: Field which teh user is looking for
+    :param found: Record of the book if it was already found e.g. by a
+    search. The record is fetched only if this lacks some of the fields.
+    :param deadline: Deadline of the turn
     :return: Response to AWS server in JSON format
     """
-    request = record(book_id, field=['id', 'shortTitle', field])['json']
-    if request['status'] == 'OK':
-        message = locate_book(request['records'][0]['buildings'])
-        title = request['records'][0]['shortTitle']
-        message = "".join([title, message])
-        return util.close({'book_id': book_id, 'author': None}, 'Fulfilled',
-                                                                message)
+    if found and 'shortTitle' in found and field in found:
+        book = found
     else:
-        return util.close({'author': None}, 'Fulfilled', "Something went wrong")
+        request = record(book_id, field=['id', 'shortTitle', field],
+                         deadline=deadline)['json']
+        if request['status'] != 'OK':
+            return util.close({'author': None}, 'Fulfilled',
+                              "Something went wrong")
+        book = request['records'][0]
+
+    message = locate_book(book[field])
+    message = "".join([book['shortTitle'], message])
+    return util.close({'book_id': book_id, 'author': None}, 'Fulfilled',
+                      message)
+
+
+def building_counts(request):
+    """
+    Counts the books of a search per library from the building facet, so
+    the books do not need to be downloaded to find out where they are
+    :param request: JSON data from the Finna API
+    :return: list of (library, count) tuples, most books first
+    """
+    counts = []
+    facets = list(request.get('facets', {}).get('building', []))
+    while facets:
+        facet = facets.pop()
+        # The facet is hierarchical, the libraries are under the university
+        facets.extend(facet.get('children', []))
+        if _library.match(facet['value']):
+            counts.append((facet['translated'], facet['count']))
+    counts.sort(key=lambda c: (-c[1], c[0]))
+    return counts
+
+
+def subject_search(subject, filter=[], deadline=None):
+    """
+    Searches books with a subject, asking only for what parse_subject
+    reads, and the number of books per library. Without a subject
+    parse_subject lists the books of the author.
+    :param subject: Subject or search term
+    :param filter: filters of the search
+    :param deadline: Deadline of the turn
+    :return: JSON data from the Finna API
+    """
+    if not subject:
+        return lookfor(term=subject, field=_author_fields, filter=filter,
+                       limit=_author_limit, deadline=deadline)['json']
+    return lookfor(term=subject, field=_subject_fields, filter=filter,
+                   limit=_subject_limit, facet=_subject_facets,
+                   deadline=deadline)['json']
+
+
+def _has_results(request):
+    return request.get('status') == 'OK' and request.get('resultCount', 0) > 0
 
 
-def parse_subject(request, subject, session_attributes={}):
+def _remember(intent, subject, filter, request):
+    """ Keeps the books of a search for the follow-up questions """
+    if subject:
+        conversation.remember(intent.get('userId'), subject, filter, request,
+                              _subject_fields)
+    else:
+        conversation.forget(intent.get('userId'))
+
+
+def _refine(intent, subject, filters, deadline=None):
+    """
+    Narrows down the previous search of the user from its books
+    :param filters: the filters of the searches, the preferred one first,
+    the last one has the fewest
+    :param deadline: Deadline of the turn
+    :return: JSON data of the first search that found books, or of the last
+    one, None if some search cannot be answered from the remembered books
+    """
+    user = intent.get('userId')
+
+    # If the books of the search that Libby asked more about fit in a page,
+    # they are fetched in one search instead of searching each refinement
+    previous = conversation.widen(user, subject, filters[-1])
+    if previous is not None:
+        request = lookfor(term=subject, field=_refine_fields, filter=previous,
+                          limit=conversation.limit(),
+                          deadline=deadline)['json']
+        conversation.remember(user, subject, previous, request,
+                              _refine_fields)
+
+    request = None
+    for filter in filters:
+        request = conversation.refine(user, subject, filter, _subject_limit)
+        if request is None or _has_results(request):
+            break
+    return request
+
+
+def parse_subject(request, subject, session_attributes={}, deadline=None):
     """
     :param request: JSON data from the Finna API
     :param subject: Subject or search term of the current session
@@ -178,16 +374,20 @@ def parse_subject(request, subject, session_attributes={}):
                               'Fulfilled', message)
 
         elif result_count == 1:
-            return find_info(request['records'][0]['id'])
+            book = request['records'][0]
+            return find_info(book['id'], found=book, deadline=deadline)
         # if less than five books was found, will be checked all different
         # locations in books way that there is not same locations twice.
         elif result_count < 5:
+            find_locations = [library for library, _ in
+                              building_counts(request)]
+
+            # without the facet the locations are read from the records
             real_count = 0
-            find_locations = []
-            while real_count < result_count:
+            while not find_locations and real_count < result_count:
                 buildings = request['records'][real_count]['buildings']
                 for layer in buildings:
-                    if re.compile("1/AALTO/([a-z])*/").match(layer['value']):
+                    if _library.match(layer['value']):
                         if layer['translated'] not in find_locations:
                             find_locations.append(layer['translated'])
                 real_count += 1
@@ -203,103 +403,84 @@ def parse_subject(request, subject, session_attributes={}):
                               'Fulfilled', message)
         # there is more than five results, this ask more information from user
         else:
+            # tell where most of the books are
+            libraries = building_counts(request)[:_top_libraries]
+            where = ""
+            if libraries:
+                where = " Most of them are in " + util.make_string_list(
+                    [library + " (" + str(count) + ")"
+                     for library, count in libraries]) + "."
+
+            # the local mirror only counts the books approximately
+            found = "I found " + str(result_count)
+            if request.get('approximate'):
+                found = "I found about " + str(result_count)
+
             if not author:
-                message = "I found " + str(result_count) + " books with term " \
-                          + subject + ". Please specify an author or a year, " \
-                                      "     so I can narrow down the search."
+                message = found + " books with term " + subject + "." + \
+                          where + " Please specify an " \
+                          "author or a year,      so I can narrow down the " \
+                          "search."
             else:
-                message = "I found " + str(result_count) + " books with " \
-                          + subject + " by author " + author + ". Can you " \
-                          "give the publication date for example to narrow " \
-                          "down the search."
+                message = found + " books with " + subject + \
+                          " by author " + author + "." + where + \
+                          " Can you give the publication date for example " \
+                          "to narrow down the search."
             return util.elicit_intent({'subject': subject, 'author': author},
                                       message)
     else:
         return util.close({'author': None}, 'Fulfilled', "Something went wrong")
 
 
-def subject_info(intent, extra_info=[]):
+def subject_info(intent, extra_info=[], deadline=None):
     """
     This function parses the input from AWS and finds the subject(search
     term) from the intent's inputTranscript.
     :param intent: the input intent
     :param extra_info: Given parameters to filter the data
+    :param deadline: Deadline of the turn
     :return: Response to AWS server in JSON format
     """
 
     text = intent['inputTranscript'].lower()
-    utterances = AS.load_file('sample_utterances.txt')
-
-    # add "book" and "books" to every utterance
-    for line in list(utterances):
-        utterances.insert(0, line + " book")
-        utterances.insert(0, line + " books")
-
-    # tells how many characters needs to be dropped before the subject starts
-    to_drop = 0
-
-    for line in utterances:
-        if text.startswith(line):
-            to_drop = len(line)
-            break
-
-    # drops the characters and makes a list from the strings that are left
-    text = text[to_drop:].strip()
-    text_list = text.split(' ', len(text))
 
-    subject_list = []
-    keywords = ["books", "book", "by", "published", "written"]
-    keyword = ""
+    # drops the utterance, and "book" or "books" after it, before the
+    # subject
+    text = utterances.subject.strip(text)
 
-    # Find out when the book name ends
-    for word in text_list:
-        if word not in keywords:
-            subject_list.append(word)
-        else:
-            break
-
-    subject = " ".join(subject_list)
-
-    # Get all the keywords in the middle, so they can be
-    # all be dropped at once, eg written by, books by
-    text_list = text_list[len(subject_list):]
-    if text_list:
-        word = text_list[0]
-        while word in keywords:
-            keyword += word + " "
-            text_list = text_list[1:]
-            if text_list:
-                word = text_list[0]
-            else:
-                break
+    # Find out when the book name ends, eg. cats written by ..., and the
+    # years it was published
+    q = query.parse(text)
 
-    # search for an author from the rest of the characters
-    author_text = text[len(keyword):].strip()
-    author = AS.search(author_text, False)
-    if author is "":
-        author = None
+    # search for an author after the subject. It takes a fraction of a
+    # millisecond from the author index, so the search is sent only once
+    # it is known which one is needed.
+    q = query.find_author(q)
+    subject = q.subject
+    author = q.author
 
     # There might be old info in the extra_info (author), so 
     # we need to clear it
     extra_info.clear()
 
-    # add the author to extra info so it can be used in the Finna API call
-    if author:
-        extra_info += ["author:\"" + author + "\""]
-    elif intent['sessionAttributes'].get('author'):
-        extra_info += [
-            "author:\"" + intent['sessionAttributes']['author'] + "\""
-        ]
+    # add the author and the years to extra info so they can be used in the
+    # Finna API call
+    session_author = intent['sessionAttributes'].get('author')
+    if session_author and not author:
+        extra_info += ["author:\"" + session_author + "\""]
+    extra_info += q.filters()
 
     # The Finna API call
-    request = lookfor(term=subject, filter=extra_info)['json']
+    request = subject_search(subject, extra_info, deadline)
 
-    return parse_subject(request, subject, {'author': author})
+    _remember(intent, subject, extra_info, request)
+    return parse_subject(request, subject, {'author': author}, deadline)
 
 
-def extra_info(intent):
+def extra_info(intent, deadline=None):
     """
     :param intent: Input from AWS servers
+    :param deadline: Deadline of the turn
     :return: Response to AWS server in JSON format
     """
     subject = intent['sessionAttributes']['subject']
@@ -313,6 +494,11 @@ def extra_info(intent):
     slot_upper = slots.get('upper')
     slot_year = slots.get('year')
 
+    # Lex may leave the slots empty, the years can still be in the transcript
+    if not (slot_lower or slot_upper or slot_year):
+        parsed = query.parse(intent['inputTranscript'].lower())
+        slot_lower, slot_upper = parsed.lower, parsed.upper
+
     # Find out if there is a publish year in intent's slots'
     if slot_lower or slot_upper or slot_year:
         if slot_lower:
@@ -327,34 +513,46 @@ def extra_info(intent):
         Add publication year range to extra info so it can be used in the 
         Finna API. Default is from 0 to 9999.
         """
-        date = "search_daterange_mv:\"[" + str(lower) + " TO " + str(
-            upper) + "]\""
-        extra_info = [date]
+        extra_info = [query.date_filter(lower, upper)]
 
-        # The Finna API call and update of session attributes
-        request = lookfor(term=subject, filter=extra_info)['json']
+        # The searches with and without the author of the session, the
+        # books of the author are preferred
+        searches = [extra_info]
+        if author:
+            searches.insert(0, extra_info + ["author:\"" + author + "\""])
+
+        # The books of the previous turn are filtered if they are known,
+        # otherwise the Finna API calls are made at the same time
+        request = _refine(intent, subject, searches, deadline)
+        if request is None:
+            request = fanout.first_useful(
+                [lambda f=f: subject_search(subject, f, deadline)
+                 for f in searches], _has_results)
         session_attributes = {'lower': lower, 'upper': upper, 'author': author}
 
-        return parse_subject(request, subject, session_attributes)
+        return parse_subject(request, subject, session_attributes, deadline)
     else:
         # If there's no publication year in slots, search for author
-        return author_search(intent, subject)
+        return author_search(intent, subject, deadline)
 
 
-def author_search(intent, subject):
+def author_search(intent, subject, deadline=None):
 
     author = AS.search(intent['inputTranscript'], False)
 
     # If author is found, make an API call with it.
     if author:
-        request = lookfor(subject, filter=["author:\"" + author + "\""])['json']
-        return parse_subject(request, subject, {'author': author})
+        by_author = ["author:\"" + author + "\""]
+        request = _refine(intent, subject, [by_author], deadline)
+        if request is None:
+            request = subject_search(subject, by_author, deadline)
+        return parse_subject(request, subject, {'author': author}, deadline)
 
     return util.elicit_intent({'subject': subject},
                               "Sorry, I didn't manage to narrow down the search with the extra information I was given.")
 
 
-def record(id, field=[], method='GET', pretty_print='0'):
+def record(id, field=[], method='GET', pretty_print='0', deadline=None):
     """
     Simple function for accessing the Finna API.
     :param id: id of the book looked for
@@ -363,8 +561,14 @@ def record(id, field=[], method='GET', pretty_print='0'):
     response is long, defaults to GET
     :param pretty_print: if the resulting JSON should be prettyprinted, '1'
     for yes and '0' for no, defaults to '0'
+    :param deadline: Deadline of the turn, the request times out when it
+    passes
     :return: a dictionary with 'status_code' from the request and 'json'
     """
+    data = catalogue.record(id, field) if catalogue.enabled() else None
+    if data is not None:
+        return {'status_code': 200, 'json': data}
+
     params = {
         'field[]': field,
         'id': [id],
@@ -372,54 +576,50 @@ def record(id, field=[], method='GET', pretty_print='0'):
         'lng': ['en-gb']
     }
 
-    sess = requests.Session()
-    sess.headers.update(__headers)
-    sess.params.update(params)
-
-    r = sess.request(url=__url + 'record', method=method)
-    sess.close()
+    r = finna.request('record', params, method, deadline)
 
     return {'status_code': r.status_code, 'json': r.json()}
 
 
-def timeout_handler(signum, frame):  # pragma: no cover
-    raise RuntimeError('Timed out!')
-
-
-def lookfor(term="", field=[], filter=[], method='GET', pretty_print='0'):
+def lookfor(term="", field=[], filter=[], method='GET', pretty_print='0',
+            limit=None, facet=[], deadline=None, page=None):
     """
     Simple function for accessing the Finna API.
     :param term: what to look for, e.g. 'software'
     :param field: what fields we want to include in the json search
     :param filter: filters the json search
+    :param limit: how many records are returned, defaults to the API's
+    default of 20
+    :param facet: fields whose values are counted over all the results
+    :param page: which page of limit records is returned, defaults to 1
     :param method: POST or GET, use of POST should be done if the reponse is
     long, defaults to GET
     :param pretty_print: if the resulting JSON should be prettyprinted, '1' for
     yes and '0' for no, defaults to '0'
+    :param deadline: Deadline of the turn, the request times out when it
+    passes
     :return: a dictionary with 'status_code' from the request and 'json'
     """
+    # the local mirror answers what it can, Finna the rest
+    if catalogue.enabled():
+        data = catalogue.search(term, filter, field, limit, page, facet)
+        if data is not None:
+            return {'status_code': 200, 'json': data}
+
     params = {
         'lookfor': [term],
         'filter[]': [
             'building:"0/AALTO/"',
         ] + filter,
         'field[]': field,
+        'limit': limit,
+        'page': page,
+        'facet[]': facet,
         'prettyPrint': [pretty_print],
         'lng': ['en-gb']
     }
     
-    signal.signal(signal.SIGALRM, timeout_handler)
-    # Allow 4 seconds to get a response back from finna api
-    signal.alarm(5)
-
-    sess = requests.Session()
-    sess.headers.update(__headers)
-    sess.params.update(params)
-
-    r = sess.request(url=__url + 'search', method=method)
-    sess.close()
-
-    signal.alarm(0)
+    r = finna.request('search', params, method, deadline)
 
     res = {'status_code': r.status_code, 'json': r.json()}
     return res
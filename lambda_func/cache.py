@@ -0,0 +1,211 @@
+"""
+Small caches that live as long as the Lambda container does: a bounded
+in-memory LRU cache and a compressed cache on disk (under /tmp in Lambda).
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A bounded cache that drops the least recently used entry when it is full.
+    Any value can be cached, None included, so "nothing found" can be
+    remembered too. The entries may expire after a time to live. Hits,
+    misses, evictions and expirations are counted, so the size of the cache
+    can be tuned. The cache can be shared between threads.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        """
+        :param maxsize: how many entries the cache holds at most
+        :param ttl: default time to live of the entries in seconds, None
+        for entries that never expire
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value of key, or default if it is not cached.
+        """
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        """
+        Caches the value of key, dropping the least recently used entry if
+        the cache is full.
+        :param ttl: time to live of this entry, defaults to self.ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Empties the cache and resets the counters """
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        """
+        :return: a dictionary with the counters and the size of the cache
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class DiskCache(object):
+    """
+    A cache of byte strings in a directory. The values are compressed with
+    zlib, and an entry expires when its file is older than the time to live
+    it is read with. When the files take more than max_bytes, the oldest
+    ones are removed. Lambda keeps /tmp between the invocations of a warm
+    container, so the cache outlives a cold module import there.
+    """
+
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        """
+        :param directory: where the files are kept, defaults to a folder in
+        the temp directory
+        :param max_bytes: how much disk the compressed values may take
+        """
+        self.directory = directory or os.path.join(tempfile.gettempdir(),
+                                                   'libby-cache')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size
+                         for entry in os.scandir(self.directory))
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.z')
+
+    def get(self, key, ttl):
+        """
+        Returns the value of key and its age in seconds, or None if it is
+        not cached or older than ttl
+        """
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > ttl:
+                raise OSError('expired')
+            with open(path, 'rb') as f:
+                data = f.read()
+            value = zlib.decompress(data)
+        except (OSError, zlib.error):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.bytes_read += len(data)
+        return value, age
+
+    def put(self, key, value):
+        """ Caches the value of key """
+        data = zlib.compress(value)
+        path = self._path(key)
+        tmp = path + '.' + str(threading.get_ident())
+
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.bytes_written += len(data)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._prune()
+
+    def _prune(self):
+        """ Removes the oldest files until the cache fits in max_bytes """
+        entries = sorted(os.scandir(self.directory),
+                         key=lambda entry: entry.stat().st_mtime)
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes // 2:
+                break
+            try:
+                os.remove(entry.path)
+                self._size -= entry.stat().st_size
+            except OSError:
+                pass
+
+    def clear(self):
+        """ Removes every file and resets the counters """
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            self._size = 0
+            self.hits = self.misses = 0
+            self.bytes_read = self.bytes_written = 0
+
+    def stats(self):
+        """
+        :return: a dictionary with the counters and the size of the cache
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written,
+                'size_bytes': self._size,
+            }
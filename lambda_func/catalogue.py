@@ -0,0 +1,363 @@
+"""
+A local mirror of the Aalto books in the Finna API.
+
+The harvester pages through the search of building:"0/AALTO/" and stores
+the titles, the authors, the years and the buildings of the books in an
+SQLite database with a full-text (FTS5) index of the titles and the
+authors. After the first, full harvest only the records that Finna has
+indexed since the previous harvest are fetched, with a filter on the
+last_indexed field of the index. A full harvest also drops the books that
+are no longer in the collection.
+
+    python catalogue.py catalogue.db          # incremental
+    python catalogue.py catalogue.db --full   # everything
+    python catalogue.py catalogue.db --titles "software engineering"
+
+When the CATALOGUE_DB environment variable names a database, book_info
+answers the searches it can from the mirror, and asks Finna when the
+mirror finds nothing, or the search has filters the mirror does not know.
+The books of an author are looked up by the name from the authors table.
+The term of a search is looked for in the full-text index. The term of a
+Finna search matches every field of a record, and the mirror only has the
+titles and the authors, so the counts of those searches are approximate
+and the data is marked with 'approximate': True. The records are also
+looked up by their id from the mirror.
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import finna
+
+
+# The searches of the collection, and the fields that are stored
+_collection = 'building:"0/AALTO/"'
+_fields = ['id', 'title', 'shortTitle', 'year', 'buildings',
+           'nonPresenterAuthors']
+
+_schema = """
+CREATE TABLE IF NOT EXISTS books (
+    id TEXT PRIMARY KEY,
+    year INTEGER,
+    record TEXT
+);
+CREATE TABLE IF NOT EXISTS authors (book_id TEXT, name TEXT);
+CREATE INDEX IF NOT EXISTS authors_name ON authors (name);
+CREATE INDEX IF NOT EXISTS authors_book ON authors (book_id);
+CREATE TABLE IF NOT EXISTS buildings (book_id TEXT, value TEXT,
+                                      translated TEXT);
+CREATE INDEX IF NOT EXISTS buildings_book ON buildings (book_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, authors, tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# The filters of book_info that the mirror can answer
+_author_filter = re.compile(r'^author:"(.*)"$')
+_date_filter = re.compile(r'^search_daterange_mv:"\[(\d+) TO (\d+)\]"$')
+
+_path = os.getenv('CATALOGUE_DB')
+_local = threading.local()
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def connect(path):
+    """ Opens a database, creating the tables if needed """
+    conn = sqlite3.connect(path)
+    conn.executescript(_schema)
+    return conn
+
+
+def _store(conn, record):
+    """ Adds a record to the database, replacing the old version of it """
+    book_id = record['id']
+
+    # The full-text row of a book has the rowid of the book, so it is
+    # found without scanning the index
+    old = conn.execute('SELECT rowid FROM books WHERE id = ?',
+                       (book_id,)).fetchone()
+    if old:
+        conn.execute('DELETE FROM books_fts WHERE rowid = ?', old)
+    for table, column in [('books', 'id'), ('authors', 'book_id'),
+                          ('buildings', 'book_id')]:
+        conn.execute('DELETE FROM %s WHERE %s = ?' % (table, column),
+                     (book_id,))
+
+    year = str(record.get('year') or '')
+    authors = [a.get('name', '') for a in
+               record.get('nonPresenterAuthors') or []]
+    data = dict((field, record[field]) for field in _fields
+                if field in record)
+
+    rowid = conn.execute('INSERT INTO books VALUES (?, ?, ?)',
+                         (book_id, int(year) if year.isdigit() else None,
+                          json.dumps(data, ensure_ascii=False))).lastrowid
+    conn.executemany('INSERT INTO authors VALUES (?, ?)',
+                     [(book_id, name.lower()) for name in authors])
+    conn.executemany('INSERT INTO buildings VALUES (?, ?, ?)',
+                     [(book_id, b.get('value'), b.get('translated'))
+                      for b in record.get('buildings') or []])
+    conn.execute('INSERT INTO books_fts (rowid, title, authors) '
+                 'VALUES (?, ?, ?)',
+                 (rowid, record.get('title', ''), ' '.join(authors)))
+
+
+def _finna_search(params):
+    """ Searches Finna without the response cache """
+    response = finna.get_transport().request(
+        'GET', finna.API_URL + 'search', params, finna._headers)
+    return response.json()
+
+
+def harvest(path, full=False, page_size=100, search=_finna_search):
+    """
+    Copies the books of the collection from Finna to the database
+    :param path: the database
+    :param full: whether everything is fetched, instead of the records that
+    were indexed since the previous harvest
+    :param page_size: how many records are fetched at a time
+    :param search: function that returns the JSON data of a Finna search
+    of the given parameters
+    :return: how many records were stored
+    """
+    started = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    # A full harvest is made into a new file, so the books that are no
+    # longer in Finna are dropped and the old mirror works until the end
+    target = path + '.new' if full else path
+    if full and os.path.exists(target):
+        os.remove(target)
+    conn = connect(target)
+
+    filters = [_collection]
+    row = conn.execute("SELECT value FROM meta WHERE key = 'synced'").fetchone()
+    if row and not full:
+        filters.append('last_indexed:"[' + row[0] + ' TO *]"')
+
+    count = 0
+    page = 1
+    while True:
+        data = search({'lookfor': '', 'filter[]': filters, 'field[]': _fields,
+                       'limit': page_size, 'page': page, 'lng': 'en-gb'})
+        records = data.get('records', [])
+        with conn:
+            for record in records:
+                _store(conn, record)
+        count += len(records)
+
+        if not records or page * page_size >= data.get('resultCount', 0):
+            break
+        page += 1
+
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('synced', ?)",
+                     (started,))
+    conn.close()
+
+    if full:
+        os.replace(target, path)
+    return count
+
+
+def use(path):
+    """ Sets the database book_info answers from, None for no mirror """
+    global _path
+    _path = path
+    _local.__dict__.clear()
+
+
+def enabled():
+    return bool(_path) and os.path.exists(_path)
+
+
+def _connection():
+    """
+    The connection of this thread, SQLite connections are not shared. It is
+    opened again when a full harvest has replaced the file.
+    """
+    stat = os.stat(_path)
+    key = (_path, stat.st_ino, stat.st_mtime)
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.key != key:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect('file:' + _path + '?mode=ro', uri=True)
+        _local.conn, _local.key = conn, key
+    return conn
+
+
+def _count(kind):
+    with _stats_lock:
+        _stats[kind] += 1
+
+
+def stats():
+    """ :return: how many searches were answered from the mirror """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _stored(fields):
+    """ Whether the mirror has the fields, it does not have whole records """
+    return bool(fields) and set(fields) <= set(_fields)
+
+
+def _project(record, fields):
+    data = json.loads(record)
+    return dict((field, data[field]) for field in fields if field in data)
+
+
+def _match(term):
+    """ The full-text query of the words of a term, all of them must match """
+    return ' '.join('"' + word + '"' for word in re.findall(r'\w+',
+                                                            term.lower()))
+
+
+def search(term='', filter=[], field=[], limit=None, page=None, facet=[]):
+    """
+    Searches the mirror like book_info.lookfor searches Finna. The term is
+    looked for in the titles and the authors, best matches first, while
+    Finna looks for it in every field of the records. The result of a
+    search with a term is therefore marked approximate.
+    :return: JSON data like that of Finna, or None if the mirror cannot
+    answer the search or found nothing
+    """
+    if not _stored(field):
+        return None
+
+    source = 'books b'
+    order = 'b.rowid'
+    where = []
+    args = []
+
+    match = _match(term)
+    if match:
+        source += ' JOIN books_fts f ON f.rowid = b.rowid'
+        order = 'f.rank'
+        where.append('books_fts MATCH ?')
+        args.append(match)
+    elif term.strip():
+        return None
+
+    for f in filter:
+        author = _author_filter.match(f)
+        date = _date_filter.match(f)
+        if f == _collection:
+            continue
+        elif author:
+            where.append('b.id IN (SELECT book_id FROM authors '
+                         'WHERE name = ?)')
+            args.append(author.group(1).lower())
+        elif date:
+            where.append('b.year BETWEEN ? AND ?')
+            args.extend([int(date.group(1)), int(date.group(2))])
+        else:
+            _count('misses')
+            return None
+
+    if not enabled():
+        return None
+
+    condition = ' WHERE ' + ' AND '.join(where) if where else ''
+    try:
+        conn = _connection()
+        total = conn.execute('SELECT COUNT(*) FROM ' + source + condition,
+                             args).fetchone()[0]
+        if not total:
+            _count('misses')
+            return None
+
+        limit = 20 if limit is None else int(limit)
+        offset = ((int(page) if page else 1) - 1) * limit
+        rows = conn.execute('SELECT b.record FROM ' + source + condition +
+                            ' ORDER BY ' + order + ' LIMIT ? OFFSET ?',
+                            args + [limit, offset]).fetchall()
+
+        data = {'status': 'OK', 'resultCount': total,
+                'records': [_project(row[0], field) for row in rows]}
+        if match:
+            data['approximate'] = True
+
+        if 'building' in facet:
+            counts = conn.execute(
+                'SELECT value, translated, COUNT(DISTINCT book_id) '
+                'FROM buildings WHERE book_id IN (SELECT b.id FROM ' +
+                source + condition + ') GROUP BY value, translated',
+                args).fetchall()
+            data['facets'] = {'building': [
+                {'value': value, 'translated': translated, 'count': count}
+                for value, translated, count in counts]}
+    except (OSError, sqlite3.Error):
+        # e.g. a mirror that is being replaced, Finna answers instead
+        _count('misses')
+        return None
+
+    _count('hits')
+    return data
+
+
+def titles(term, limit=20):
+    """
+    Looks for books by the words of their titles and authors, best matches
+    first, e.g. to check what a harvest stored
+    :return: list of (id, title) tuples
+    """
+    match = _match(term)
+    if not match or not enabled():
+        return []
+    rows = _connection().execute(
+        'SELECT b.record FROM books_fts f JOIN books b ON b.rowid = f.rowid '
+        'WHERE books_fts MATCH ? ORDER BY f.rank LIMIT ?',
+        (match, limit)).fetchall()
+    return [(data['id'], data.get('title')) for data in
+            (json.loads(row[0]) for row in rows)]
+
+
+def record(book_id, field=[]):
+    """
+    Finds a book of the mirror by its id, like book_info.record
+    :return: JSON data like that of Finna, or None if it is not there
+    """
+    if not enabled() or not _stored(field):
+        return None
+    try:
+        row = _connection().execute('SELECT record FROM books WHERE id = ?',
+                                    (book_id,)).fetchone()
+    except (OSError, sqlite3.Error):
+        row = None
+    if row is None:
+        _count('misses')
+        return None
+    _count('hits')
+    return {'status': 'OK', 'resultCount': 1,
+            'records': [_project(row[0], field)]}
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description='Harvest the Aalto books')
+    parser.add_argument('db', help='the database')
+    parser.add_argument('--full', action='store_true',
+                        help='fetch everything, not only the changes')
+    parser.add_argument('--titles', metavar='WORDS',
+                        help='list the stored books with the words instead')
+    args = parser.parse_args()
+
+    if args.titles:
+        use(args.db)
+        for book_id, title in titles(args.titles):
+            print(book_id + '\t' + str(title))
+        return
+
+    count = harvest(args.db, args.full)
+    print('%d records stored to %s' % (count, args.db))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
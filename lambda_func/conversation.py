@@ -0,0 +1,169 @@
+"""
+Remembers the books the previous turn of a user found, so the follow-up
+questions can be answered without asking Finna again.
+
+When FindBook finds too many books, Libby asks for an author or a year.
+The search of FindBook stays a page of a few records, and only how many
+books it found is kept per user id. When the user answers, and the books
+of that search fit in a page of limit() records, they are all fetched
+once with their years and authors, instead of searching each refinement
+from Finna. ExtraInfo then filters those books by the author and the
+years, and so do the next follow-up questions, as long as the filters of
+the search are a part of the new ones. Otherwise Finna is asked as
+before.
+
+The books are approximated from the records: the years are the year
+field, and the author filter matches the nonPresenterAuthors of a record.
+"""
+
+import os
+import re
+from collections import namedtuple
+
+import cache
+
+
+# How many books are fetched at most for the follow-up questions, so the
+# searches that find a few more books than are named are known whole.
+# 0 turns the cache off.
+_records = int(os.getenv('CONVERSATION_RECORDS', '20'))
+
+# How many users are remembered, and for how many seconds
+_results = cache.LRUCache(int(os.getenv('CONVERSATION_USERS', '1000')),
+                          int(os.getenv('CONVERSATION_TTL', '600')))
+
+_author_filter = re.compile(r'^author:"(.*)"$')
+_date_filter = re.compile(r'^search_daterange_mv:"\[(\d+) TO (\d+)\]"$')
+
+# The fields of the records that the books are filtered and located by
+_fields = ['year', 'nonPresenterAuthors', 'buildings']
+
+
+# A search of a user, filters is a tuple of its Finna filters, count how
+# many books it found and records every one of them, or None if only the
+# count is known
+Entry = namedtuple('Entry', ['subject', 'filters', 'count', 'records'])
+
+
+def enabled():
+    return _records > 0
+
+
+def limit():
+    """ :return: how many books a search may find to be remembered whole """
+    return _records
+
+
+def remember(user, subject, filters, data, fields=[]):
+    """
+    Keeps the books a search found for the user, if it has all of them
+    with the fields they are filtered by. Otherwise only how many books
+    were found is kept.
+    :param data: JSON data of the search from the Finna API
+    :param fields: the fields of the records of the search
+    """
+    if not user:
+        return
+    if not enabled() or data.get('status') != 'OK':
+        forget(user)
+        return
+    count = data.get('resultCount', 0)
+    records = list(data.get('records') or [])
+    if count > len(records) or not set(_fields) <= set(fields):
+        records = None
+    _results.put(user, Entry(subject, tuple(filters), count, records))
+
+
+def forget(user):
+    """ Drops the books of the user, e.g. after a search of another subject """
+    if user:
+        _results.put(user, None)
+
+
+def _known(filter):
+    """ Whether the books can be filtered with a Finna filter here """
+    return bool(_author_filter.match(filter) or _date_filter.match(filter))
+
+
+def _matches(record, filter):
+    """ Whether a record passes an author or a date filter of Finna """
+    author = _author_filter.match(filter)
+    if author:
+        name = author.group(1).lower()
+        return any(a.get('name', '').lower() == name
+                   for a in record.get('nonPresenterAuthors') or [])
+
+    date = _date_filter.match(filter)
+    if date:
+        year = str(record.get('year') or '')
+        return year.isdigit() and \
+            int(date.group(1)) <= int(year) <= int(date.group(2))
+    return False
+
+
+def _facet(records):
+    """ The building facet of the records, like Finna counts it """
+    counts = {}
+    for record in records:
+        buildings = set((b.get('value'), b.get('translated'))
+                        for b in record.get('buildings') or [])
+        for building in buildings:
+            counts[building] = counts.get(building, 0) + 1
+    return [{'value': value, 'translated': translated, 'count': count}
+            for (value, translated), count in sorted(counts.items())]
+
+
+def _entry(user, subject, filters):
+    """ The remembered search of the user that the filters narrow down """
+    entry = _results.get(user) if user and enabled() else None
+    if entry is None or entry.subject != subject or \
+            not set(entry.filters) <= set(filters):
+        return None
+    rest = set(filters) - set(entry.filters)
+    if not all(_known(filter) for filter in rest):
+        return None
+    return entry
+
+
+def refine(user, subject, filters, limit=None):
+    """
+    Searches the remembered books of the user
+    :param filters: the Finna filters of the search
+    :param limit: how many records are returned, all by default
+    :return: JSON data like that of Finna, or None if the books of the
+    search are not remembered
+    """
+    entry = _entry(user, subject, filters)
+    if entry is None or entry.records is None:
+        return None
+
+    records = entry.records
+    for filter in set(filters) - set(entry.filters):
+        records = [record for record in records if _matches(record, filter)]
+
+    return {'status': 'OK', 'resultCount': len(records),
+            'records': records[:limit],
+            'facets': {'building': _facet(records)}}
+
+
+def widen(user, subject, filters):
+    """
+    Tells whether the books of the previous search of the user should be
+    fetched to answer a search of the filters and the next ones. They are
+    when only their number is known, they fit in a page of limit()
+    records, and the filters narrow the previous search down.
+    :return: the filters of the previous search, or None
+    """
+    entry = _entry(user, subject, filters)
+    if entry is None or entry.records is not None or \
+            not 0 < entry.count <= _records:
+        return None
+    return list(entry.filters)
+
+
+def clear():
+    _results.clear()
+
+
+def stats():
+    return _results.stats()
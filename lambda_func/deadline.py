@@ -0,0 +1,65 @@
+"""
+The time a turn has left to be answered.
+
+The handler makes a Deadline of the time the Lambda invocation has left,
+and it is passed to every request to the Finna API. The timeouts of the
+requests are derived from it, so the turn is answered, if only with an
+apology, before the invocation is killed.
+"""
+
+import os
+import time
+
+
+# Seconds that are kept for building the answer after the last request
+_margin = float(os.getenv('DEADLINE_MARGIN', '0.3'))
+
+# Seconds a turn has when the invocation does not tell, e.g. in tests
+_default = float(os.getenv('DEADLINE_DEFAULT', '5'))
+
+# Seconds at most that are waited for a new connection
+_connect_timeout = float(os.getenv('CONNECT_TIMEOUT', '2'))
+
+
+class DeadlineExceeded(RuntimeError):
+    """ The turn ran out of time """
+
+
+class Deadline(object):
+    """ A point in time by which the turn must be answered """
+
+    def __init__(self, seconds):
+        """
+        :param seconds: how many seconds from now the deadline is
+        """
+        self.expires = time.monotonic() + seconds
+
+    @classmethod
+    def from_context(cls, context, margin=_margin):
+        """
+        Makes the deadline of the Lambda invocation
+        :param context: the Lambda context, or None
+        :param margin: seconds kept for answering after the requests
+        """
+        if context is None or not hasattr(context,
+                                          'get_remaining_time_in_millis'):
+            return cls(_default)
+        return cls(context.get_remaining_time_in_millis() / 1000.0 - margin)
+
+    def remaining(self):
+        """ :return: seconds left, 0 if the deadline has passed """
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeouts(self):
+        """
+        The timeouts of a request that has to finish by the deadline
+        :return: (connect timeout, read timeout) in seconds
+        :raises DeadlineExceeded: if there is no time left
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded('Timed out!')
+        return min(remaining, _connect_timeout), remaining
@@ -0,0 +1,67 @@
+"""
+Runs independent calls, e.g. Finna searches, at the same time.
+
+A turn has to be answered within the response window of Lex, so searches
+that do not depend on each other are sent concurrently instead of one after
+another. The threads are shared by all the turns of the container.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+_executor = ThreadPoolExecutor(int(os.getenv('FANOUT_WORKERS', '4')))
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Starts a call in the background, e.g. a search that is likely needed
+    :return: a Future of the result, cancel it if the result is not needed
+    """
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def first_useful(calls, useful=bool, timeout=None):
+    """
+    Runs the calls concurrently and returns the result of the first call,
+    in the order of the list, whose result is useful. The result of a call
+    is not waited for if an earlier call was already useful, and the calls
+    that have not started are cancelled. A call that has started runs to
+    the end, but its result is dropped.
+    :param calls: functions without parameters, the preferred one first
+    :param useful: tells whether a result can be used
+    :param timeout: seconds to wait for the results in total
+    :return: the first useful result, or the last result if none of them
+    is useful
+    :raises TimeoutError: if the results did not come in time
+    :raises: the exception of the first call that failed if none of the
+    calls gave a result
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    futures = [_executor.submit(call) for call in calls]
+    results = []
+    error = None
+    try:
+        for future in futures:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            try:
+                result = future.result(remaining)
+            except TimeoutError:
+                raise
+            except Exception as e:
+                error = error or e
+                continue
+
+            if useful(result):
+                return result
+            results.append(result)
+
+        if results:
+            return results[-1]
+        raise error
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,320 @@
+"""
+Client of the Finna API.
+
+Documentation of the API can be found on the following link:
+https://www.kiwi.fi/pages/viewpage.action?pageId=53839221
+
+The requests are sent through a transport. The default one keeps the
+connections to the API open and reuses them, so a warm Lambda container
+does not pay for a new TCP and TLS handshake on every request. The requests
+are retried, hedged and stopped when the API keeps failing, see
+resilience.py. The transport can be replaced with set_transport, e.g. in
+tests.
+
+Successful GET responses are cached in two tiers: in memory for the warm
+container, and compressed on disk under /tmp, which a warm container keeps
+between invocations. How long the responses of an endpoint are kept is set
+with the FINNA_SEARCH_TTL and FINNA_RECORD_TTL environment variables in
+seconds, 0 turns the caching of the endpoint off.
+"""
+
+import http.client
+import json
+import os
+import queue
+import socket
+import threading
+import urllib.parse
+
+import cache
+import deadline as _deadline
+import resilience
+
+
+"""This is the URL for the Finna API with a needed header for proper results"""
+API_URL = 'https://api.finna.fi/api/v1/'
+_headers = {'Accept': 'application/json'}
+
+
+class Response(object):
+    """ The status code and the body of a response """
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self._json = None
+
+    def json(self):
+        """
+        Decodes the body once, cached responses are read many times. The
+        same data is returned to every turn and thread that gets the
+        response from the cache, so the callers must not change it.
+        """
+        if self._json is None:
+            self._json = json.loads(self.body.decode('utf-8'))
+        return self._json
+
+
+def _encode(params):
+    """
+    Encodes query parameters, lists as repeated parameters. None values are
+    left out.
+    """
+    pairs = []
+    for key, values in sorted(params.items()):
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        pairs.extend((key, value) for value in values if value is not None)
+    return urllib.parse.urlencode(pairs)
+
+
+class HTTPTransport(object):
+    """
+    Sends requests over persistent HTTP/1.1 connections. The idle
+    connections are pooled per host, and a connection is only used by one
+    request at a time, so the transport can be shared between threads.
+    """
+
+    def __init__(self, pool_size=4, timeout=10):
+        """
+        :param pool_size: how many idle connections are kept per host
+        :param timeout: default socket timeout in seconds
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = queue.LifoQueue(self.pool_size)
+                self._pools[key] = pool
+            return pool
+
+    @staticmethod
+    def _connect(scheme, host, timeout):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=timeout)
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def request(self, method, url, params=None, headers=None, timeout=None):
+        """
+        Sends a request and reads the whole response
+        :param method: e.g. 'GET'
+        :param url: the URL without the query string
+        :param params: dictionary of query parameters, the values may be
+        lists for repeated parameters such as filter[]
+        :param headers: dictionary of request headers
+        :param timeout: socket timeout in seconds, or a tuple of the
+        connect and read timeouts, defaults to self.timeout
+        :return: a Response
+        """
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path
+        if params:
+            path += '?' + _encode(params)
+        timeout = self.timeout if timeout is None else timeout
+        if isinstance(timeout, tuple):
+            connect_timeout, timeout = timeout
+        else:
+            connect_timeout = timeout
+
+        pool = self._pool((parts.scheme, parts.netloc))
+
+        while True:
+            try:
+                conn = pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connect(parts.scheme, parts.netloc,
+                                     connect_timeout)
+                reused = False
+
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(timeout)
+                conn.timeout = timeout
+                conn.request(method, path, headers=headers or {})
+                r = conn.getresponse()
+                body = r.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError):
+                conn.close()
+                # The server has closed an idle connection, try another one
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if r.will_close:
+            conn.close()
+        else:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+        return Response(r.status, body)
+
+    def close(self):
+        """ Closes all the idle connections """
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+# The transport shared by every request of the container
+_transport = resilience.ResilientTransport(HTTPTransport())
+
+
+def get_transport():
+    return _transport
+
+
+def transport_stats():
+    """
+    :return: the state of the circuit breaker and the retry and hedge
+    counters of the transport, if it keeps them
+    """
+    stats = getattr(_transport, 'stats', None)
+    return stats() if stats else {}
+
+
+def set_transport(transport):
+    """
+    Replaces the transport that is used for the requests
+    :return: the previous transport
+    """
+    global _transport
+    previous = _transport
+    _transport = transport
+    return previous
+
+
+# Seconds the responses of each endpoint are cached
+_ttl = {
+    'search': int(os.getenv('FINNA_SEARCH_TTL', '300')),
+    'record': int(os.getenv('FINNA_RECORD_TTL', '3600')),
+}
+
+_memory = cache.LRUCache(int(os.getenv('FINNA_CACHE_SIZE', '256')))
+_disk = cache.DiskCache(os.getenv('FINNA_CACHE_DIR'))
+
+# Bytes of response bodies that were served from the cache
+_bytes_saved = 0
+_bytes_lock = threading.Lock()
+
+# Requests of the current turn, reset by the handler for every event
+_calls = {'sent': 0, 'cached': 0}
+_calls_lock = threading.Lock()
+
+
+def _count(kind):
+    with _calls_lock:
+        _calls[kind] += 1
+
+
+def _saved(response):
+    global _bytes_saved
+    with _bytes_lock:
+        _bytes_saved += len(response.body)
+    _count('cached')
+    return response
+
+
+def call_counts():
+    """
+    :return: how many requests were sent to the API and how many were
+    answered from the cache since reset_call_counts
+    """
+    with _calls_lock:
+        return dict(_calls)
+
+
+def reset_call_counts():
+    with _calls_lock:
+        for kind in _calls:
+            _calls[kind] = 0
+
+
+def cache_stats():
+    """
+    :return: the counters of the response caches, e.g. for logging
+    """
+    return {
+        'memory': _memory.stats(),
+        'disk': _disk.stats(),
+        'bytes_saved': _bytes_saved,
+    }
+
+
+def clear_cache():
+    """ Empties both tiers of the response cache """
+    global _bytes_saved
+    _memory.clear()
+    _disk.clear()
+    with _bytes_lock:
+        _bytes_saved = 0
+
+
+def _send(endpoint, params, method, deadline):
+    """ Sends a request by the deadline, if there is one """
+    timeout = deadline.timeouts() if deadline else None
+    _count('sent')
+    try:
+        return _transport.request(method, API_URL + endpoint, params,
+                                  _headers, timeout)
+    except socket.timeout:
+        if deadline:
+            raise _deadline.DeadlineExceeded('Timed out!')
+        raise
+
+
+def request(endpoint, params, method='GET', deadline=None):
+    """
+    Sends a request to the Finna API, or answers it from the cache
+    :param endpoint: 'search' or 'record'
+    :param params: the query parameters
+    :param method: POST or GET
+    :param deadline: the Deadline of the turn, the request times out when
+    it passes
+    :return: a Response
+    :raises DeadlineExceeded: if the deadline passes before the response
+    """
+    ttl = _ttl.get(endpoint, 0)
+    if method != 'GET' or ttl <= 0:
+        return _send(endpoint, params, method, deadline)
+
+    key = endpoint + '?' + _encode(params)
+
+    response = _memory.get(key)
+    if response is not None:
+        return _saved(response)
+
+    cached = _disk.get(key, ttl)
+    if cached is not None:
+        body, age = cached
+        response = Response(200, body)
+        _memory.put(key, response, ttl - age)
+        return _saved(response)
+
+    response = _send(endpoint, params, method, deadline)
+    if response.status_code == 200:
+        _memory.put(key, response, ttl)
+        try:
+            _disk.put(key, response.body)
+        except OSError:
+            # A full or read-only disk only makes the cache smaller
+            pass
+    return response
@@ -1,4 +1,6 @@
 from router import Router
+from deadline import Deadline
+import finna
 import util
 # --------------- Main handler ------------------
 
@@ -8,7 +10,9 @@ def lambda_handler(event, context):
     if debug:
         return util.debug(event)
 
-    router = Router(event)
+    # Count the Finna requests of this turn only, see finna.call_counts
+    finna.reset_call_counts()
+    router = Router(event, Deadline.from_context(context))
     
     error_message = {'sessionAttributes': {'author': None}, 
                      'dialogAction': {
@@ -0,0 +1,139 @@
+"""
+Parses a book question into a Query of the subject, the author and the
+years of publication, e.g.
+
+    "cats written by vogel steven published between 2001 and 2003"
+    -> Query(subject='cats', author='vogel, steven', lower=2001,
+             upper=2003, keywords=['written', 'by', 'published'])
+
+The keywords and the year phrases are found with one compiled regular
+expression in a single pass over the transcript. The subject is what
+comes before the first of them. A year without a word before it, like
+"published" or "in", only counts after the subject has ended, so titles
+with numbers are not taken for years. The author is spotted in the rest of the
+transcript, and only if there is something there besides keywords and
+years.
+"""
+
+import re
+from collections import namedtuple
+
+import author_search as AS
+
+
+# Words that end the subject, e.g. cats written by ...
+keywords = ["books", "book", "by", "published", "written"]
+
+_year = r'(\d{4})'
+
+# Every alternative is a whole phrase of words separated by whitespace
+_grammar = re.compile(r'''
+    (?<!\S)(?:
+        (?:published\s+)?between\s+{y}\s+and\s+{y}
+      | (?:published\s+)?(?:before|until)\s+{y}
+      | (?:published\s+)?(?:after|since)\s+{y}
+      | (?:published\s+)?(?:(?:in|from)\s+)?{y}
+      | ({keyword})
+    )(?!\S)
+'''.format(y=_year, keyword='|'.join(keywords)), re.X)
+
+
+class Query(namedtuple('Query', ['subject', 'author', 'lower', 'upper',
+                                 'keywords', 'text', 'end'])):
+    """
+    subject: what the books are about, '' if nothing
+    author: the name of the author as in the author list, or None
+    lower, upper: the years of publication, or None
+    keywords: the keywords of the transcript in order
+    text: the transcript that was parsed
+    end: where the subject ends in text, None if nothing ended it
+    """
+
+    def filters(self):
+        """ :return: the filters of the Finna search of the query """
+        filters = []
+        if self.author:
+            filters.append("author:\"" + self.author + "\"")
+        if self.lower is not None or self.upper is not None:
+            filters.append(date_filter(self.lower, self.upper))
+        return filters
+
+
+def date_filter(lower=None, upper=None):
+    """
+    :return: Finna filter of the books published between the years,
+    from 0 to 9999 by default
+    """
+    lower = 0 if lower is None else lower
+    upper = 9999 if upper is None else upper
+    return "search_daterange_mv:\"[" + str(lower) + " TO " + str(upper) + \
+           "]\""
+
+
+def parse(text):
+    """
+    Parses the keywords and the years of a transcript, without the author
+    :param text: the transcript in lowercase, the utterance stripped
+    :return: a Query
+    """
+    end = None
+    lower = upper = None
+    found = []
+
+    for match in _grammar.finditer(text):
+        between_lower, between_upper, before, after, year, keyword = \
+            match.groups()
+
+        # A number alone is a year only after the subject has ended, e.g.
+        # "cats books 2001", otherwise it is a part of the subject, e.g.
+        # "2001 a space odyssey"
+        if end is None and match.group() == year:
+            continue
+
+        if end is None:
+            end = match.start()
+        if keyword:
+            found.append(keyword)
+        elif between_lower:
+            lower, upper = int(between_lower), int(between_upper)
+        elif before:
+            upper = int(before)
+        elif after:
+            lower = int(after)
+        elif year:
+            lower = upper = int(year)
+
+        if match.group().startswith('published') and 'published' not in found:
+            found.append('published')
+
+    subject = text if end is None else text[:end]
+    return Query(subject.strip(), None, lower, upper, found, text, end)
+
+
+def _rest_is_grammar(query):
+    """ Whether there is nothing but keywords and years after the subject """
+    rest = query.text[query.end:]
+    return not _grammar.sub('', rest).strip()
+
+
+def find_author(query, fname='authors_clean.txt'):
+    """
+    Spots the author of a parsed query. If nothing ended the subject, the
+    author may follow it right away, but at least one word is left for the
+    subject. Without a keyword only names of two or more words are taken,
+    a single word is more likely a part of the subject, e.g. 'rings' in
+    'lord of the rings'.
+    :return: the Query with the author, and the subject without it
+    """
+    if query.end is None:
+        match = AS.spot(query.text, fname, after=1, words=2)
+        if match:
+            return query._replace(subject=query.text[:match.start].strip(),
+                                  author=match.name, end=match.start)
+        return query
+
+    if _rest_is_grammar(query):
+        return query
+
+    match = AS.spot(query.text, fname, after=query.end)
+    return query._replace(author=match.name) if match else query
@@ -0,0 +1,133 @@
+"""
+Records responses of the Finna API and replays them without the network.
+
+RecordingTransport sends the requests through another transport and keeps
+the responses. They are saved to a fixture file of gzipped JSON lines, one
+request per line. ReplayTransport answers the requests from such a file,
+after a configurable latency, so the handlers can be run and benchmarked
+end to end on a box without access to api.finna.fi:
+
+    store = replay.load('finna_fixtures.jsonl.gz')
+    finna.set_transport(replay.ReplayTransport(store, latency=0.05))
+
+A request that was not recorded raises UnmatchedRequest, and is also kept
+in the unmatched list of the transport, because the handler answers any
+exception with an apology.
+"""
+
+import gzip
+import json
+import random
+import socket
+import threading
+import time
+
+import finna
+
+
+class UnmatchedRequest(LookupError):
+    """ A request that is not in the fixtures """
+
+
+def request_key(method, url, params=None):
+    """
+    The key of a request in the fixtures, e.g.
+    'GET https://api.finna.fi/api/v1/record?field%5B%5D=id&id=x'
+    """
+    key = method + ' ' + url
+    if params:
+        key += '?' + finna._encode(params)
+    return key
+
+
+def load(path):
+    """
+    Reads a fixture file
+    :return: dictionary of request keys to (status code, body) tuples
+    """
+    store = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                fixture = json.loads(line)
+                store[fixture['request']] = (fixture['status'],
+                                             fixture['body'].encode('utf-8'))
+    return store
+
+
+def save(store, path):
+    """ Writes the fixtures to a file, sorted by the request """
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for key, (status, body) in sorted(store.items()):
+            f.write(json.dumps({'request': key, 'status': status,
+                                'body': body.decode('utf-8')},
+                               ensure_ascii=False, sort_keys=True) + '\n')
+
+
+class RecordingTransport(object):
+    """ Sends the requests with another transport and keeps the responses """
+
+    def __init__(self, transport, store=None):
+        """
+        :param transport: the transport the requests are sent with
+        :param store: fixtures the responses are added to
+        """
+        self.transport = transport
+        self.store = {} if store is None else store
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, headers=None, timeout=None):
+        response = self.transport.request(method, url, params, headers,
+                                          timeout)
+        with self._lock:
+            self.store[request_key(method, url, params)] = (
+                response.status_code, response.body)
+        return response
+
+    def save(self, path):
+        with self._lock:
+            save(self.store, path)
+
+
+class ReplayTransport(object):
+    """ Answers the requests from recorded fixtures """
+
+    def __init__(self, store, latency=0.0, jitter=0.0, seed=None):
+        """
+        :param store: the fixtures, see load
+        :param latency: seconds every response takes
+        :param jitter: seconds at most that are added to the latency at
+        random
+        :param seed: seed of the jitter, so the runs are comparable
+        """
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.unmatched = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, headers=None, timeout=None):
+        key = request_key(method, url, params)
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fixture = self.store.get(key)
+            if fixture is None:
+                self.unmatched.append(key)
+
+        if fixture is None:
+            raise UnmatchedRequest('No fixture for ' + key)
+
+        # A response slower than the read timeout times out like a socket
+        if isinstance(timeout, tuple):
+            timeout = timeout[1]
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise socket.timeout('timed out')
+
+        if delay > 0:
+            time.sleep(delay)
+        status, body = fixture
+        return finna.Response(status, body)
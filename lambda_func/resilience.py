@@ -0,0 +1,279 @@
+"""
+Keeps the Finna API usable when it is slow or failing.
+
+ResilientTransport wraps another transport, e.g. finna.HTTPTransport:
+
+- GET requests that fail or get a 5xx response are retried after a
+  random (jittered) backoff, while there is time left of the timeout.
+- When a request takes longer than most requests do (a percentile of the
+  recent latencies), the same request is sent again and the response that
+  comes first is used (hedging).
+- After repeated failures the circuit breaker opens, and the requests fail
+  right away without waiting for the API, until it is tried again after a
+  while.
+"""
+
+import collections
+import http.client
+import math
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class CircuitOpenError(RuntimeError):
+    """ The API has failed repeatedly, so it is not tried for a while """
+
+
+def _shorten(timeout, seconds):
+    """
+    :return: the timeout, or the connect and read timeouts, less the
+    seconds, None if there is no time left
+    """
+    if timeout is None:
+        return None
+    if isinstance(timeout, tuple):
+        read = timeout[1] - seconds
+        return (min(timeout[0], read), read) if read > 0 else None
+    timeout -= seconds
+    return timeout if timeout > 0 else None
+
+
+class ResilientTransport(object):
+    """
+    A transport that retries, hedges and stops using a failing API. It can
+    be shared between threads.
+    """
+
+    def __init__(self, transport, retries=2, backoff=0.05, max_backoff=1.0,
+                 hedge_percentile=95, hedge_samples=20, window=100,
+                 failure_threshold=5, reset_timeout=30):
+        """
+        :param transport: the transport the requests are sent with
+        :param retries: how many times a failed GET request is retried
+        :param backoff: seconds the first retry waits at most, the wait
+        doubles for every retry and is picked at random up to that
+        :param max_backoff: seconds a retry waits at most
+        :param hedge_percentile: percentile of the recent latencies after
+        which a request is sent again, None for no hedging
+        :param hedge_samples: how many latencies are needed before hedging
+        :param window: how many recent latencies are kept
+        :param failure_threshold: how many failures in a row open the
+        circuit breaker
+        :param reset_timeout: seconds the circuit breaker stays open
+        """
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_samples = hedge_samples
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(4)
+        self._random = random.Random()
+
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.requests = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+
+    def hedge_delay(self):
+        """
+        :return: seconds after which a request is sent again, or None if
+        there are not enough latencies to tell
+        """
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.hedge_samples:
+            return None
+        rank = int(math.ceil(self.hedge_percentile / 100.0 * len(latencies)))
+        return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+    def stats(self):
+        """
+        :return: a dictionary of the state of the circuit breaker and the
+        counters, e.g. for logging
+        """
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'requests': self.requests,
+                'retried': self.retried,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'short_circuited': self.short_circuited,
+                'hedge_delay_ms': None if delay is None else delay * 1000,
+            }
+
+    def _allow(self):
+        """ Checks the circuit breaker before a request is sent """
+        with self._lock:
+            self.requests += 1
+            if self.state != 'closed':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.short_circuited += 1
+                    raise CircuitOpenError('The Finna API is failing')
+                # Let one request try whether the API works again, the
+                # others fail right away while it is tried. If it fails the
+                # breaker opens again, and if it never ends another request
+                # is let through after reset_timeout.
+                self.state = 'half-open'
+                self.opened_at = time.monotonic()
+
+    def _succeeded(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self.failures = 0
+            self.state = 'closed'
+
+    def _failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half-open' or \
+                    self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def _send(self, method, url, params, headers, timeout):
+        """ Sends the request once, recording how it went """
+        start = time.monotonic()
+        try:
+            response = self.transport.request(method, url, params, headers,
+                                              timeout)
+        except (OSError, http.client.HTTPException):
+            self._failed()
+            raise
+
+        if response.status_code >= 500:
+            self._failed()
+        else:
+            self._succeeded(time.monotonic() - start)
+        return response
+
+    def _hedged(self, send, timeout=None, end=None):
+        """
+        Sends the request, and again if it takes longer than usual. The
+        second request gets the time that is left of the timeout.
+        :param send: function of the timeout that sends the request once
+        :param end: time.monotonic() by which the response is needed
+        :return: the response that came first
+        :raises socket.timeout: if no response came by the end
+        """
+        delay = self.hedge_delay()
+        if delay is None:
+            return send(timeout)
+
+        first = self._executor.submit(send, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        pending = [first]
+        hedge_timeout = _shorten(timeout, delay)
+        if hedge_timeout is not None or timeout is None:
+            with self._lock:
+                self.hedged += 1
+            second = self._executor.submit(send, hedge_timeout)
+            pending.append(second)
+
+        error = None
+        while pending:
+            remaining = None
+            if end is not None:
+                remaining = max(0.0, end - time.monotonic())
+            done, pending = wait(pending, timeout=remaining,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                # The requests time out by themselves, they are not waited
+                raise socket.timeout('timed out')
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if future is not first:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return response
+        raise error
+
+    def request(self, method, url, params=None, headers=None, timeout=None):
+        """
+        Sends a request like the wrapped transport does
+        :param timeout: socket timeout in seconds, or a tuple of the
+        connect and read timeouts. The read timeout is also the time the
+        retries may take in total.
+        :raises CircuitOpenError: if the API has failed repeatedly
+        """
+        self._allow()
+
+        if method != 'GET':
+            return self._send(method, url, params, headers, timeout)
+
+        end = None
+        if timeout is not None:
+            read = timeout[1] if isinstance(timeout, tuple) else timeout
+            end = time.monotonic() + read
+
+        attempt = 0
+        while True:
+            if end is not None:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    # A timeout of 0 would make the socket non-blocking, and
+                    # the request would fail against the circuit breaker
+                    raise socket.timeout('timed out')
+                if isinstance(timeout, tuple):
+                    timeout = (min(timeout[0], remaining), remaining)
+                else:
+                    timeout = remaining
+
+            def send(timeout):
+                return self._send(method, url, params, headers, timeout)
+
+            error = None
+            try:
+                response = self._hedged(send, timeout, end)
+                if response.status_code < 500 or attempt >= self.retries:
+                    return response
+            except (OSError, http.client.HTTPException) as e:
+                if attempt >= self.retries:
+                    raise
+                error = e
+
+            wait_for = self._random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if end is not None and time.monotonic() + wait_for >= end:
+                # No time for another try
+                if error is not None:
+                    raise error
+                return response
+
+            with self._lock:
+                self.retried += 1
+                if self.state == 'open':
+                    # The retries count as failures too, stop when the
+                    # breaker opens
+                    self.short_circuited += 1
+                    raise CircuitOpenError('The Finna API is failing')
+            time.sleep(wait_for)
+            attempt += 1
+
+    def close(self):
+        if hasattr(self.transport, 'close'):
+            self.transport.close()
@@ -16,9 +16,11 @@ method(last method in this class).
 
 
 class Router:
-    def __init__(self, intent):
+    def __init__(self, intent, deadline=None):
         # print(intent['name'])
         self.intent = intent
+        # Deadline of the turn, given to the intents that call the Finna API
+        self.deadline = deadline
         self.intents = {"Get_Categories": robertscoffee.intro,
                         "Get_Prices": robertscoffee.prices,
                         "Get_Drinks": robertscoffee.drinks,
@@ -46,11 +48,11 @@ class Router:
         if name == "Get_Help":
             return self.intents[name](self.intent['currentIntent'])
         if name == "FindBook":
-            return self.intents[name](self.intent)
+            return self.intents[name](self.intent, deadline=self.deadline)
         if name == "ExtraInfo":
-            return self.intents[name](self.intent)
+            return self.intents[name](self.intent, deadline=self.deadline)
         if name == "Location":
             return self.intents[name](self.intent)
         if name == "Author":
-            return self.intents[name](self.intent)
+            return self.intents[name](self.intent, deadline=self.deadline)
         return self.intents[name]()
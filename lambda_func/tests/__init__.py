@@ -0,0 +1,47 @@
+import contextlib
+import json
+from lambda_func import book_info
+
+
+class FakeTransport(object):
+    """
+    A transport of finna that answers the requests with a function instead
+    of the Finna API. The url and the parameters of the requests are kept
+    in requests.
+    """
+
+    def __init__(self, respond, finna):
+        self.respond = respond
+        self.finna = finna
+        self.requests = []
+
+    def request(self, method, url, params=None, headers=None, timeout=None):
+        self.requests.append((url, params))
+        response = self.respond(url, params)
+        if isinstance(response, self.finna.Response):
+            return response
+        return self.finna.Response(200, json.dumps(response).encode('utf-8'))
+
+
+@contextlib.contextmanager
+def fake_finna(respond, finna=book_info.finna, cached=False):
+    """
+    Sends the Finna requests to a FakeTransport while in the block, and
+    restores the transport afterwards
+    :param respond: function of the url and the parameters of a request,
+    that returns the JSON data of the response or a finna.Response
+    :param finna: the module, by default the one the handlers use, which
+    is imported without the package
+    :param cached: whether the responses are cached, they are not by default
+    :return: the FakeTransport
+    """
+    transport = FakeTransport(respond, finna)
+    previous = finna.set_transport(transport)
+    ttl = finna._ttl
+    if not cached:
+        finna._ttl = {}
+    try:
+        yield transport
+    finally:
+        finna.set_transport(previous)
+        finna._ttl = ttl
@@ -0,0 +1,97 @@
+import unittest
+import os
+import tempfile
+from bisect import bisect_left
+from difflib import get_close_matches
+from lambda_func import author_index
+
+
+class TestAuthorIndex(unittest.TestCase):
+
+    def test_load(self):
+        index = author_index.load('tests/authors_test.txt')
+
+        assert(len(index) == 8)
+        assert(index[0] == 'albert, einstein')
+        assert(index[-1] == 'tomi, liimatta')
+        assert('liima, lasse' in index)
+        assert('liima' not in index)
+
+        # the index is opened only once
+        assert(author_index.load('tests/authors_test.txt') is index)
+
+    def test_build_unsorted(self):
+        tmp = tempfile.mkdtemp()
+        src = os.path.join(tmp, 'authors.txt')
+        with open(src, 'w', encoding='utf-8') as f:
+            f.write('öhman, anna\nbeta, b\n\nalpha, a\nbeta, b\n')
+
+        index = author_index.AuthorIndex(author_index.build(src, src + '.idx'))
+        assert(list(index) == ['alpha, a', 'beta, b', 'öhman, anna'])
+        assert(bisect_left(index.names, 'beta, b') == 1)
+        assert(index.lookup('Anna Ohman') == ['öhman, anna'])
+        assert(index.lookup('ohman') == [])
+        index.close()
+
+        # an index that is up to date is used as is
+        assert(author_index.index_path(src) == src + '.idx')
+
+        with open(src, 'a', encoding='utf-8') as f:
+            f.write('gamma, c\n')
+        assert(author_index.index_path(src) != src + '.idx')
+
+    def test_trigrams(self):
+        assert(author_index.trigrams('dodo') == ['dod', 'odo'])
+        assert(author_index.trigrams('dodo, dodo')[-2:] == ['dod1', 'odo1'])
+        assert(author_index.trigrams('ab') == [])
+
+    def test_close_matches(self):
+        index = author_index.load('tests/authors_test.txt')
+        names = list(index)
+        words = ['albert, ainstein', 'jobbs, steve', 'steve, jobs', 'liima',
+                 'lasse, liima', 'dodo dodo', 'sorsa, mies', 'ab', '']
+
+        for word in words:
+            assert(index.close_matches(word, 1, 0.9) ==
+                   get_close_matches(word, names, 1, 0.9))
+            assert(index.close_matches(word, 3, 0.6) ==
+                   get_close_matches(word, names, 3, 0.6))
+
+        assert(index.close_matches('albert, ainstein') == ['albert, einstein'])
+
+    def test_phonetic(self):
+        assert(author_index.phonetic_key('vogel, steven') == 'fkl stfn')
+        assert(author_index.phonetic_key('Fogel Stephen') == 'fkl stfn')
+        assert(author_index.phonetic_key('kärkkäinen') ==
+               author_index.phonetic_key('karkainen'))
+
+        index = author_index.load('tests/authors_test.txt')
+        assert(index.sounds_like('steve, jops') == ['steve, jobs'])
+        assert(index.sounds_like('sorsa, mies') == [])
+        assert(index.sounds_like('') == [])
+
+    def test_fold(self):
+        assert(author_index.fold('Kärkkäinen, Matti') == 'karkkainen matti')
+        assert(author_index.fold('2000.hel.fi, euroopan kulttuurikaupunki') ==
+               '2000 hel fi euroopan kulttuurikaupunki')
+        assert(author_index.fold(' ,. ') == '')
+
+    def test_spoken(self):
+        assert(author_index.spoken_forms('vogel, steven') ==
+               ['vogel steven', 'steven vogel'])
+        assert(author_index.spoken_forms(', jonathan') == ['jonathan'])
+        assert(author_index.spoken_forms('öhman, a.') == ['ohman a', 'a ohman'])
+
+        index = author_index.load('tests/authors_test.txt')
+        assert(index.spoken('einstein albert') == (['albert, einstein'], False))
+        assert(index.spoken('liima') == ([], True))
+        assert(index.spoken('mies') == ([], False))
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAuthorIndex)
+    unittest.TextTestRunner(verbosity=2).run(suite)
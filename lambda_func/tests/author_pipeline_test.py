@@ -0,0 +1,102 @@
+import unittest
+import gzip
+import json
+import os
+import tempfile
+from lambda_func import author_index, author_pipeline
+
+
+class TestAuthorPipeline(unittest.TestCase):
+
+    records = [
+        {'id': '1', 'nonPresenterAuthors': [{'name': 'Vogel, Steven '}]},
+        {'id': '2', 'nonPresenterAuthors': [{'name': 'Hearn,  Donald'},
+                                            {'name': 'Baker, M. Pauline'}]},
+        {'id': '3', 'primaryAuthors': ['Vogel, Steven'],
+         'corporateAuthors': ['Aalto-yliopisto']},
+        {'id': '4', 'nonPresenterAuthors': {'primary': [{'name': 'Öhman, A'}]}},
+        {'id': '5'},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def test_normalize(self):
+        assert(author_pipeline.normalize('Vogel, Steven ') == 'vogel, steven')
+        assert(author_pipeline.normalize('2000.hel.fi, x') == '2000.hel.fi, x')
+
+        # The spelling of the catalogue is kept, the names are compared to
+        # those of the records as they are
+        assert(author_pipeline.normalize('Bejan,  Adrian') == 'bejan,  adrian')
+        assert(author_pipeline.normalize('Aristotle,') == 'aristotle,')
+
+        # The names of the list stay as they are
+        with open('authors_clean.txt', 'r', encoding='utf-8') as f:
+            names = [line[:-1] for line in f]
+        assert('aaker, david a.' in names and 'bejan,  adrian' in names)
+        for name in names:
+            assert(author_pipeline.normalize(name) == name)
+        for name in names[:1000]:
+            assert(author_pipeline.normalize(name.title()) == name)
+
+    def test_external_sort(self):
+        names = ['d', 'b', 'a', 'b', 'c', 'a', 'e', 'd']
+        for chunk_size in [1, 2, 3, 100]:
+            result = list(author_pipeline.external_sort(names, chunk_size,
+                                                        self.tmp))
+            assert(result == ['a', 'b', 'c', 'd', 'e'])
+
+        # the run files are removed
+        assert(os.listdir(self.tmp) == [])
+
+    def test_rebuild(self):
+        src = os.path.join(self.tmp, 'records.jsonl.gz')
+        with gzip.open(src, 'wt', encoding='utf-8') as f:
+            for record in self.records[:3]:
+                f.write(json.dumps(record) + '\n')
+
+        # a line can also be a whole search response
+        src2 = os.path.join(self.tmp, 'response.jsonl')
+        with open(src2, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'records': self.records[3:]}) + '\n\n')
+
+        dst = os.path.join(self.tmp, 'authors.txt')
+        count = author_pipeline.rebuild([src, src2], dst, chunk_size=2)
+
+        with open(dst, 'r', encoding='utf-8') as f:
+            names = f.read().splitlines()
+
+        assert(count == 5)
+        assert(names == ['aalto-yliopisto', 'baker, m. pauline',
+                         'hearn,  donald', 'vogel, steven', 'öhman, a'])
+
+        index = author_index.AuthorIndex(dst + '.idx')
+        assert(list(index) == names)
+        index.close()
+
+    def test_check_sorted(self):
+        dst = os.path.join(self.tmp, 'authors.txt')
+        with open(dst, 'w', encoding='utf-8') as f:
+            f.write('aya\naagaard, kim\n')
+
+        with self.assertRaises(ValueError):
+            author_pipeline.check_sorted(dst)
+
+        with self.assertRaises(ValueError):
+            author_pipeline.write_sorted(['b', 'a'], dst)
+
+        # the old file is left as it was
+        with open(dst, 'r', encoding='utf-8') as f:
+            assert(f.read() == 'aya\naagaard, kim\n')
+
+    def test_authors_clean_sorted(self):
+        assert(author_pipeline.check_sorted('authors_clean.txt') > 0)
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAuthorPipeline)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,33 @@
+import unittest
+from lambda_func.benchmarks import author_search_bench as bench
+
+
+class TestAuthorSearchBench(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert(bench.percentile(values, 50) == 50)
+        assert(bench.percentile(values, 99) == 99)
+        assert(bench.percentile([3], 95) == 3)
+
+    def test_run(self):
+        result = bench.run('tests/authors_test.txt', count=4, cold_runs=0)
+
+        assert(result['authors'] == 8)
+        for mode in ['search', 'search_normal', 'search_closest']:
+            assert(result['modes'][mode]['p50_ms'] <=
+                   result['modes'][mode]['p99_ms'])
+
+        assert(bench.compare(result, result, 1.0) == [])
+
+        faster = {'modes': {'search': {'p95_ms': -1}}}
+        assert(len(bench.compare(result, faster, 1.5)) == 1)
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAuthorSearchBench)
+    unittest.TextTestRunner(verbosity=2).run(suite)
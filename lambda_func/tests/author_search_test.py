@@ -58,7 +58,118 @@ class TestAuthorSearch(unittest.TestCase):
             found = AS.search_closest(author, 'tests/authors_test.txt')
             assert(found is None)
      
+    def test_phonetic_search(self):
+        authors_found = ['Albert Einstein', 'Nikita Kuts']
+        authors_heard = ['Albert Ainstein', 'steve jops', 'books by nikita kutz']
+        authors_far = ['sorsa mies', 'John Locke', 'tell me books']
+
+        for author in authors_found:
+            found = AS.search_phonetic(author, 'tests/authors_test.txt')
+            assert(found is not None)
+
+        for author in authors_heard:
+            found = AS.search_phonetic(author, 'tests/authors_test.txt')
+            assert(found is not None)
+
+        for author in authors_far:
+            found = AS.search_phonetic(author, 'tests/authors_test.txt')
+            assert(found is None)
+
+        found = AS.search_phonetic('steve jops', 'tests/authors_test.txt')
+        assert(found == 'steve, jobs')
      
+    def test_spot(self):
+        sentence = 'books about physics by Albert Einstein and steve jobs'
+        matches = AS.spot_all(sentence, 'tests/authors_test.txt')
+
+        assert(len(matches) == 2)
+        assert(matches[0].name == 'albert, einstein')
+        assert(sentence[matches[0].start:matches[0].end] == 'Albert Einstein')
+        assert(matches[1].name == 'steve, jobs')
+
+        found = AS.spot('cats by dodo dodo', 'tests/authors_test.txt')
+        assert(found == ('dodo, dodo', 8, 17))
+
+        found = AS.spot('lasse liima', 'tests/authors_test.txt', after=1)
+        assert(found is None)
+
+        found = AS.spot('sorsa mies', 'tests/authors_test.txt')
+        assert(found is None)
+
+    def test_cache(self):
+        AS._cache.clear()
+
+        found = AS.search('Books by  ALBERT einstein', False, 'tests/authors_test.txt')
+        assert(found == 'albert, einstein')
+        found = AS.search('books by albert einstein', False, 'tests/authors_test.txt')
+        assert(found == 'albert, einstein')
+
+        # authors that are not found are cached too
+        AS.search('sorsa mies', True, 'tests/authors_test.txt')
+        AS.search('sorsa mies', True, 'tests/authors_test.txt')
+
+        stats = AS.cache_stats()
+        assert(stats['hits'] == 2)
+        assert(stats['misses'] == 2)
+        assert(stats['size'] == 2)
+
+    def test_topk(self):
+        found = AS.search_topk('books by Albert Einstein', 3,
+                               'tests/authors_test.txt')
+        assert(found[0] == ('albert, einstein', 1.0))
+
+        found = AS.search_topk('lasse liima or tomi liimata', 3,
+                               'tests/authors_test.txt')
+        assert(found[0].name == 'liima, lasse')
+        assert(found[1].name == 'tomi, liimatta')
+        assert(found[0].score > found[1].score)
+
+        found = AS.search_topk('steve jops', 1, 'tests/authors_test.txt')
+        assert(len(found) == 1)
+        assert(found[0].name == 'steve, jobs')
+
+        found = AS.search_topk('sorsa mies', 3, 'tests/authors_test.txt')
+        assert(found == [])
+
+    def test_topk_cache(self):
+        AS._cache.clear()
+        fname = 'tests/authors_test.txt'
+
+        # The cutoff is a part of the key
+        AS.search_topk('steve jops', 1, fname, cutoff=0.99)
+        AS.search_topk('steve jops', 1, fname)
+        assert(AS.cache_stats()['size'] == 2)
+        assert(AS.cache_stats()['hits'] == 0)
+
+        # Results cut short by the time budget are not cached
+        AS._cache.clear()
+        AS.search_topk('lasse liima', 3, fname, budget=-1)
+        assert(AS.cache_stats()['size'] == 0)
+        AS.search_topk('lasse liima', 3, fname)
+        assert(AS.cache_stats()['size'] == 1)
+
+    def test_incremental(self):
+        matcher = AS.IncrementalMatcher('tests/authors_test.txt')
+
+        assert(matcher.update('books by albert') == [])
+        assert(matcher.live() == ['albert'])
+
+        found = matcher.update('books by albert einstein')
+        assert(found == [('albert, einstein', 2, 4)])
+
+        # 'einstein albert' could still follow
+        assert(matcher.live() == ['einstein'])
+
+        # the hypothesis is revised, only the changed words are matched
+        nodes = len(matcher._nodes)
+        assert(matcher.update('books by albert') == [])
+        assert(matcher.best() is None)
+        assert(len(matcher._nodes) == nodes)
+
+        matcher.update('books by albert einstein or steve jobs')
+        assert(matcher.best() == ('albert, einstein', 2, 4))
+        assert(len(matcher.matches) == 2)
+
     def test_normal_search(self):
         authors_found = ['Albert Einstein', 'Nikita Kuts']
         authors_close = ['Albert Ainstein', 'jobbs steve']
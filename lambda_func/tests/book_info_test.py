@@ -1,7 +1,9 @@
 import unittest
 import json
+import time
 import requests
 from lambda_func import main_handler, book_info
+from lambda_func.tests import fake_finna
 
 
 class TestBookInfo(unittest.TestCase):
@@ -21,18 +23,158 @@ class TestBookInfo(unittest.TestCase):
             sess = requests.Session()
             sess.headers.update(self.headers)
 
-            right_result = sess.request(url=test_input['url'],
-                                        method='GET').json()
-            sess.close()
+            def search(page, url=test_input['url']):
+                url = url.replace('page=1', 'page=' + str(page))
+                return sess.request(url=url, method='GET').json()
+
+            right_result = search(1)
 
             subject = test_input.get('subject', 'default subject')
             author = test_input.get('author')
             if is_author:
                 assert(result == book_info.parse_author(right_result,
-                                                        {'author': author}))
+                                                        {'author': author},
+                                                        search))
             else:
                 assert (result == book_info.parse_subject(right_result, subject,
                                                           {'author': author}))
+            sess.close()
+
+    def test_single_hit(self):
+        # The module the handlers use, which is imported without the package
+        finna = book_info.finna
+        book = {'id': 'aalto.123', 'shortTitle': 'Cats',
+                'buildings': [{'value': '0/AALTO/', 'translated': 'Aalto'},
+                              {'value': '1/AALTO/herlin/',
+                               'translated': 'Harald Herlin'}]}
+        found = {'status': 'OK', 'resultCount': 1, 'records': [book]}
+
+        def respond(url, params):
+            if url.endswith('record'):
+                return {'status': 'OK', 'records': [book]}
+            return found
+
+        with fake_finna(respond) as transport:
+            event = self.test_data['findCatBooks']
+            result = main_handler.lambda_handler(event, None)
+            message = result['dialogAction']['message']['content']
+            assert(message == 'Cats is located in Harald Herlin')
+            assert(finna.call_counts()['sent'] == 1)
+
+            # The record is fetched if the search did not return its fields
+            del book['shortTitle']
+            found['records'] = [dict(book)]
+            book['shortTitle'] = 'Cats'
+            transport.requests.clear()
+            main_handler.lambda_handler(event, None)
+            urls = [url for url, _ in transport.requests]
+            assert(len(urls) == 2 and urls[1].endswith('record'))
+            assert(finna.call_counts()['sent'] == 2)
+
+    def test_one_search(self):
+        # The author is spotted before the search is sent, so a question
+        # that names one sends a single search
+        with fake_finna(lambda url, params: {'status': 'OK',
+                                             'resultCount': 0}) as transport:
+            main_handler.lambda_handler(self.test_data['bookWithAuthor'],
+                                        None)
+            assert([params['filter[]'] for _, params in transport.requests]
+                   == [['building:"0/AALTO/"', 'author:"vogel, steven"']])
+
+    def test_author_candidates(self):
+        # The books of the candidates are searched at the same time
+        AS = book_info.AS
+
+        def respond(url, params):
+            time.sleep(0.1)
+            return {'status': 'OK', 'resultCount': 1, 'records': [
+                {'title': 'T', 'nonPresenterAuthors': [
+                    {'name': 'Someone, Else'}]}]}
+
+        search_topk = AS.search_topk
+        AS.search_topk = lambda text, k: [
+            AS.Candidate('hearn, donald', 0.9),
+            AS.Candidate('hearne, don', 0.88),
+            AS.Candidate('horn, donna', 0.86)]
+        try:
+            with fake_finna(respond) as transport:
+                start = time.time()
+                result = book_info.find_info_author(
+                    {'inputTranscript': 'books by donald hern'})
+                assert(time.time() - start < 0.25)
+                terms = [params['lookfor'][0]
+                         for _, params in transport.requests]
+                assert(sorted(terms) == ['hearn, donald', 'hearne, don',
+                                         'horn, donna'])
+
+            # None of them has written books, the first one is named
+            message = result['dialogAction']['message']['content']
+            assert(message.endswith('hearn, donald'))
+        finally:
+            AS.search_topk = search_topk
+
+    def test_building_counts(self):
+        request = {
+            'status': 'OK', 'resultCount': 120, 'records': [],
+            'facets': {'building': [{
+                'value': '0/AALTO/', 'translated': 'Aalto', 'count': 120,
+                'children': [
+                    {'value': '1/AALTO/otaniemi/', 'translated': 'Otaniemi',
+                     'count': 20},
+                    {'value': '1/AALTO/herlin/',
+                     'translated': 'Harald Herlin', 'count': 100}]}]}}
+
+        assert(book_info.building_counts(request) ==
+               [('Harald Herlin', 100), ('Otaniemi', 20)])
+        assert(book_info.building_counts({'records': []}) == [])
+
+        result = book_info.parse_subject(request, 'cat')
+        message = result['dialogAction']['message']['content']
+        assert('Most of them are in Harald Herlin (100) and Otaniemi (20).'
+               in message)
+
+        # Less than five books are located without reading the records
+        request['resultCount'] = 3
+        result = book_info.parse_subject(request, 'cat')
+        message = result['dialogAction']['message']['content']
+        assert(message == 'cat books can be found in Harald Herlin and '
+                          'Otaniemi')
+
+    def test_author_titles(self):
+        def page_of(titles, count):
+            return {'status': 'OK', 'resultCount': count, 'records': [
+                {'title': title,
+                 'nonPresenterAuthors': [{'name': name}]}
+                for title, name in titles]}
+
+        pages = {
+            1: page_of([('A', 'Hearn, Donald'), ('B', 'Someone'),
+                        ('A', 'Hearn, Donald')], 100),
+            2: page_of([('C', 'Hearn, Donald'), ('D', 'Hearn, Donald')], 100),
+            3: page_of([('E', 'Hearn, Donald'), ('F', 'Hearn, Donald')], 100),
+        }
+        for page in range(4, 10):
+            pages[page] = page_of([('G', 'Someone')], 100)
+        fetched = []
+
+        def search(page):
+            fetched.append(page)
+            return pages[page]
+
+        titles = book_info.author_titles('hearn, donald', pages[1], search)
+        assert(list(titles) == ['A', 'C', 'D', 'E', 'F'])
+        # At most _author_pages pages are fetched
+        assert(fetched == list(range(2, book_info._author_pages + 1)))
+
+        # The pages are only fetched until there are titles enough
+        fetched.clear()
+        result = book_info.parse_author(pages[1], {'author': 'hearn, donald'},
+                                        search)
+        message = result['dialogAction']['message']['content']
+        assert(message == 'hearn, donald has written books A, C, D and others')
+        assert(fetched == [2, 3])
+
+        assert(book_info.books_written_by(pages[1], 'hearn, donald') == ['A'])
 
 
 def main():  # pragma: no cover
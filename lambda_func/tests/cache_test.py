@@ -0,0 +1,91 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from lambda_func import cache
+
+
+class TestCache(unittest.TestCase):
+
+    def test_lru(self):
+        lru = cache.LRUCache(2)
+        lru.put('a', 1)
+        lru.put('b', None)
+
+        assert(lru.get('a') == 1)
+        assert(lru.get('b', 'missing') is None)
+        assert(lru.get('c', 'missing') == 'missing')
+
+        # 'a' is used more recently than 'b', so 'b' is dropped
+        lru.get('a')
+        lru.put('c', 3)
+        assert('b' not in lru)
+        assert('a' in lru and 'c' in lru)
+
+        assert(lru.stats() == {'hits': 3, 'misses': 1, 'evictions': 1,
+                               'expirations': 0, 'size': 2, 'maxsize': 2})
+
+        lru.clear()
+        assert(len(lru) == 0)
+        assert(lru.stats()['hits'] == 0)
+
+    def test_lru_ttl(self):
+        lru = cache.LRUCache(4, ttl=60)
+        lru.put('a', 1)
+        lru.put('b', 2, ttl=0.01)
+        time.sleep(0.02)
+
+        assert(lru.get('a') == 1)
+        assert(lru.get('b', 'missing') == 'missing')
+        assert('b' not in lru)
+        assert(lru.stats()['expirations'] == 1)
+
+    def test_disk(self):
+        directory = tempfile.mkdtemp()
+        try:
+            disk = cache.DiskCache(directory, max_bytes=10000)
+            disk.put('a', b'x' * 1000)
+
+            value, age = disk.get('a', 60)
+            assert(value == b'x' * 1000)
+            assert(0 <= age < 60)
+            assert(disk.get('b', 60) is None)
+
+            # Expired when the file is older than the time to live
+            old = time.time() - 120
+            os.utime(disk._path('a'), (old, old))
+            assert(disk.get('a', 60) is None)
+
+            stats = disk.stats()
+            assert(stats['hits'] == 1 and stats['misses'] == 2)
+            # The value is compressed on disk
+            assert(0 < stats['bytes_written'] < 1000)
+
+            # A new cache in the same folder sees the old files
+            assert(cache.DiskCache(directory).stats()['size_bytes'] > 0)
+
+            disk.clear()
+            assert(os.listdir(directory) == [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_disk_prune(self):
+        directory = tempfile.mkdtemp()
+        try:
+            disk = cache.DiskCache(directory, max_bytes=2000)
+            for i in range(0, 20):
+                disk.put(str(i), os.urandom(500))
+            assert(disk.stats()['size_bytes'] <= 2000)
+            assert(disk.get('19', 60) is not None)
+        finally:
+            shutil.rmtree(directory)
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
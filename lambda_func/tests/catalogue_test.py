@@ -0,0 +1,175 @@
+import unittest
+import os
+import shutil
+import tempfile
+from lambda_func import book_info, main_handler
+from lambda_func.tests import fake_finna
+
+# The module book_info uses, which is imported without the package
+catalogue = book_info.catalogue
+
+
+def _book(id, title, authors, year, building='1/AALTO/herlin/'):
+    return {'id': id, 'title': title, 'shortTitle': title, 'year': year,
+            'nonPresenterAuthors': [{'name': a} for a in authors],
+            'buildings': [{'value': '0/AALTO/', 'translated': 'Aalto'},
+                          {'value': building, 'translated': building}],
+            'summary': ['not stored']}
+
+
+_books = [
+    _book('a1', 'Software engineering', ['Vogel, Steven'], '2001'),
+    _book('a2', 'Cats and dogs', ['Vogel, Steven'], '2003'),
+    _book('a3', 'Software for cats', ['Smith, Anna'], '1999',
+          '1/AALTO/kandi/'),
+]
+
+
+class _Finna(object):
+    """ Answers the searches of the harvest from a list of books """
+
+    def __init__(self, books):
+        self.books = books
+        self.searches = []
+
+    def __call__(self, params):
+        self.searches.append(params)
+        start = (params['page'] - 1) * params['limit']
+        return {'status': 'OK', 'resultCount': len(self.books),
+                'records': self.books[start:start + params['limit']]}
+
+
+def _event(name, transcript):
+    return {'userId': 'user', 'sessionAttributes': {},
+            'inputTranscript': transcript,
+            'currentIntent': {'name': name, 'slots': {}}}
+
+
+class TestCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = os.path.join(self.directory, 'catalogue.db')
+        self.finna = _Finna(_books)
+        assert(catalogue.harvest(self.db, full=True, page_size=2,
+                                 search=self.finna) == 3)
+        catalogue.use(self.db)
+
+    def tearDown(self):
+        catalogue.use(None)
+        shutil.rmtree(self.directory)
+
+    def test_harvest(self):
+        assert([s['page'] for s in self.finna.searches] == [1, 2])
+        assert(self.finna.searches[0]['filter[]'] == ['building:"0/AALTO/"'])
+
+        # Only the changes are fetched after the first harvest
+        changed = _Finna([_book('a2', 'Cats and mice', ['Vogel, Steven'],
+                                '2003')])
+        assert(catalogue.harvest(self.db, search=changed) == 1)
+        since = changed.searches[0]['filter[]'][1]
+        assert(since.startswith('last_indexed:"[') and since.endswith(' TO *]"'))
+
+        assert(catalogue.titles('mice') == [('a2', 'Cats and mice')])
+        assert(catalogue.titles('dogs') == [])
+        data = catalogue.record('a2', ['title'])
+        assert(data['records'] == [{'title': 'Cats and mice'}])
+
+        # A full harvest drops the books that are gone
+        catalogue.harvest(self.db, full=True, search=_Finna(_books[:1]))
+        assert(catalogue.search('', field=['id'])['resultCount'] == 1)
+
+    def test_search(self):
+        data = catalogue.search('', ['search_daterange_mv:"[1999 TO 2001]"'],
+                                ['id'], facet=['building'])
+        assert(data['resultCount'] == 2)
+        assert(sorted(r['id'] for r in data['records']) == ['a1', 'a3'])
+        counts = dict((b['value'], b['count'])
+                      for b in data['facets']['building'])
+        assert(counts == {'0/AALTO/': 2, '1/AALTO/herlin/': 1,
+                          '1/AALTO/kandi/': 1})
+
+        data = catalogue.search('', ['author:"vogel, steven"'], ['id'])
+        assert(data['resultCount'] == 2)
+        data = catalogue.search('', ['author:"vogel, steven"',
+                                     'search_daterange_mv:"[2002 TO 9999]"'],
+                                ['title'])
+        assert(data['records'] == [{'title': 'Cats and dogs'}])
+
+        data = catalogue.search('', field=['id'], limit=2, page=2)
+        assert(data['resultCount'] == 3 and len(data['records']) == 1)
+
+        # A term is looked for in the titles and the authors. Finna looks
+        # for it in every field, so the count is approximate.
+        data = catalogue.search('software', field=['id'], facet=['building'])
+        assert(data['resultCount'] == 2 and data['approximate'])
+        assert(sorted(r['id'] for r in data['records']) == ['a1', 'a3'])
+        counts = dict((b['value'], b['count'])
+                      for b in data['facets']['building'])
+        assert(counts['1/AALTO/kandi/'] == 1)
+        data = catalogue.search('Cats', ['author:"vogel, steven"'], ['id'])
+        assert(data['records'] == [{'id': 'a2'}])
+        assert('approximate' not in catalogue.search('', field=['id']))
+
+        # What the mirror does not know, Finna is asked
+        assert(catalogue.search('birds', field=['id']) is None)
+        assert(catalogue.search('?', field=['id']) is None)
+        assert(catalogue.search('', ['format:"0/Book/"'], ['id']) is None)
+        assert(catalogue.search('', field=['summary']) is None)
+        assert(catalogue.search('') is None)
+        assert(catalogue.search('', ['author:"nobody"'], ['id']) is None)
+
+        # The full-text index finds the words of the titles and authors
+        assert(sorted(catalogue.titles('software')) ==
+               [('a1', 'Software engineering'), ('a3', 'Software for cats')])
+        assert(catalogue.titles('smith cats') == [('a3', 'Software for cats')])
+
+    def test_record(self):
+        data = catalogue.record('a3', ['buildings'])
+        assert(data['records'][0]['buildings'][1]['value'] ==
+               '1/AALTO/kandi/')
+        assert(catalogue.record('x', ['buildings']) is None)
+
+    def test_book_info(self):
+        nothing = {'status': 'OK', 'resultCount': 0}
+        with fake_finna(lambda url, params: nothing) as transport:
+            # The books of an author are looked up by the name
+            response = main_handler.lambda_handler(
+                _event('Author', 'what books are written by steven vogel'),
+                None)
+            assert('vogel, steven has written books Cats and dogs and '
+                   'Software engineering' in str(response))
+
+            # A subject is looked for in the titles and the authors
+            response = main_handler.lambda_handler(
+                _event('FindBook', 'find software books'), None)
+            assert('software books can be found in '
+                   '1/AALTO/herlin/ and 1/AALTO/kandi/' in str(response))
+
+            info = book_info.find_info('a3')
+            assert('Software for cats' in str(info))
+            assert(transport.requests == [])
+            assert(catalogue.stats()['hits'] >= 3)
+
+            # Nothing in the mirror, Finna is searched
+            r = book_info.lookfor('birds', ['id'])
+            assert(r['json']['resultCount'] == 0)
+            assert(len(transport.requests) == 1)
+            r = book_info.lookfor('', ['id'], ['author:"nobody"'])
+            assert(len(transport.requests) == 2)
+
+    def test_approximate(self):
+        # The counts of the mirror are told to be approximate
+        request = {'status': 'OK', 'resultCount': 7, 'approximate': True,
+                   'records': [], 'facets': {'building': []}}
+        response = book_info.parse_subject(request, 'software')
+        assert('I found about 7 books with term software' in str(response))
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCatalogue)
+    unittest.TextTestRunner(verbosity=2).run(suite)
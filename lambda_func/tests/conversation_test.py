@@ -0,0 +1,166 @@
+import unittest
+import contextlib
+import json
+from lambda_func import book_info, main_handler
+from lambda_func.tests import fake_finna
+
+# The module the handlers use, which is imported without the package
+conversation = book_info.conversation
+
+
+def _book(id, year, authors=[]):
+    return {'id': id, 'shortTitle': 'Book ' + id, 'year': year,
+            'nonPresenterAuthors': [{'name': a} for a in authors],
+            'buildings': [{'value': '0/AALTO/', 'translated': 'Aalto'},
+                          {'value': '1/AALTO/kandi/',
+                           'translated': 'Kandidaattikeskus'}]}
+
+
+_books = [_book('a', '1999'), _book('b', '2001', ['Vogel, Steven']),
+          _book('c', '2001'), _book('d', '2003', ['Vogel, Steven']),
+          _book('e', '2005'), _book('f', '')]
+
+# The fields of the records that the books can be filtered by
+_fields = ['id', 'shortTitle', 'year', 'nonPresenterAuthors', 'buildings']
+
+
+def _respond(url, params):
+    """ Finds the books of every search, the first page of them by default """
+    limit = params.get('limit') or 20
+    return {'status': 'OK', 'resultCount': len(_books),
+            'records': _books[:limit]}
+
+
+def _event(name, transcript, session={}, slots={}):
+    return {'userId': 'user', 'sessionAttributes': session,
+            'inputTranscript': transcript,
+            'currentIntent': {'name': name, 'slots': slots}}
+
+
+class TestConversation(unittest.TestCase):
+
+    def setUp(self):
+        stack = contextlib.ExitStack()
+        self.finna = stack.enter_context(fake_finna(_respond))
+        self.addCleanup(stack.close)
+        conversation.clear()
+
+    def tearDown(self):
+        conversation.clear()
+
+    def searches(self):
+        return [params for _, params in self.finna.requests]
+
+    def test_refine(self):
+        found = {'status': 'OK', 'resultCount': len(_books), 'records': _books}
+        conversation.remember('user', 'cats', [], found, _fields)
+
+        data = conversation.refine('user', 'cats', [
+            'search_daterange_mv:"[2000 TO 2003]"',
+            'author:"vogel, steven"'], limit=1)
+        assert(data['resultCount'] == 2)
+        assert([r['id'] for r in data['records']] == ['b'])
+        assert(data['facets']['building'][1] == {
+            'value': '1/AALTO/kandi/', 'translated': 'Kandidaattikeskus',
+            'count': 2})
+
+        # Other users, subjects and filters are not answered
+        assert(conversation.refine('other', 'cats', []) is None)
+        assert(conversation.refine('user', 'dogs', []) is None)
+        assert(conversation.refine('user', 'cats', ['format:"0/Book/"'])
+               is None)
+
+        # Nor the books of a narrower search
+        conversation.remember('user', 'cats', ['author:"vogel, steven"'],
+                              {'status': 'OK', 'resultCount': 2,
+                               'records': _books[:2]}, _fields)
+        assert(conversation.refine('user', 'cats', []) is None)
+
+        # A search that did not return all of its books, or not the fields
+        # to filter them by, is not kept
+        conversation.remember('user', 'cats', [], dict(found, resultCount=200),
+                              _fields)
+        assert(conversation.refine('user', 'cats', []) is None)
+        conversation.remember('user', 'cats', [], found, ['id', 'buildings'])
+        assert(conversation.refine('user', 'cats', []) is None)
+
+        conversation.remember('user', 'cats', [], found, _fields)
+        conversation.forget('user')
+        assert(conversation.refine('user', 'cats', []) is None)
+
+    def test_widen(self):
+        # Only the number of the books of the search is known
+        page = {'status': 'OK', 'resultCount': 6, 'records': _books[:4]}
+        conversation.remember('user', 'cats', ['author:"vogel, steven"'],
+                              page, ['id', 'buildings'])
+        filters = ['author:"vogel, steven"',
+                   'search_daterange_mv:"[2001 TO 2001]"']
+        assert(conversation.widen('user', 'cats', filters) ==
+               ['author:"vogel, steven"'])
+        assert(conversation.widen('user', 'cats', []) is None)
+        assert(conversation.widen('user', 'dogs', filters) is None)
+
+        # The books do not fit in a page
+        conversation.remember('user', 'cats', [], dict(page, resultCount=21),
+                              ['id', 'buildings'])
+        assert(conversation.widen('user', 'cats', filters) is None)
+
+        # Or they are already known
+        found = {'status': 'OK', 'resultCount': len(_books), 'records': _books}
+        conversation.remember('user', 'cats', [], found, _fields)
+        assert(conversation.widen('user', 'cats', filters) is None)
+
+    def test_follow_up(self):
+        response = main_handler.lambda_handler(
+            _event('FindBook', 'find computer books'), None)
+        assert('I found 6 books' in json.dumps(response))
+        # The search of FindBook asks for a few books
+        assert(len(self.searches()) == 1)
+        assert(self.searches()[0]['limit'] == 4)
+
+        # The answer fetches all the books of the search at once
+        response = main_handler.lambda_handler(
+            _event('ExtraInfo', 'it is published in 2001',
+                   {'subject': 'computer'}, {'year': '2001'}), None)
+        assert('computer books can be found in Kandidaattikeskus' in
+               json.dumps(response))
+        assert(len(self.searches()) == 2)
+        assert(self.searches()[1]['limit'] == conversation.limit())
+        assert(self.searches()[1]['filter[]'] == ['building:"0/AALTO/"'])
+
+        # And the next answers are found from them
+        response = main_handler.lambda_handler(
+            _event('ExtraInfo', 'it is published in 2003',
+                   {'subject': 'computer'}, {'year': '2003'}), None)
+        assert('Book d is located in Kandidaattikeskus' in
+               json.dumps(response))
+        assert(len(self.searches()) == 2)
+
+        # Another subject is searched from Finna
+        main_handler.lambda_handler(
+            _event('ExtraInfo', 'it is published in 2001',
+                   {'subject': 'cats'}, {'year': '2001'}), None)
+        assert(len(self.searches()) == 3)
+
+        # So are the books of a search that had more than fit in a page
+        records = conversation._records
+        conversation._records = 5
+        try:
+            main_handler.lambda_handler(
+                _event('FindBook', 'find computer books'), None)
+            main_handler.lambda_handler(
+                _event('ExtraInfo', 'it is published in 2001',
+                       {'subject': 'computer'}, {'year': '2001'}), None)
+            assert(len(self.searches()) == 5)
+            assert(self.searches()[4]['limit'] == 4)
+        finally:
+            conversation._records = records
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestConversation)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,42 @@
+import unittest
+from lambda_func import deadline
+
+
+class _Context(object):
+    def get_remaining_time_in_millis(self):
+        return 3000
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_from_context(self):
+        d = deadline.Deadline.from_context(_Context(), margin=0.5)
+        assert(2.4 < d.remaining() <= 2.5)
+        assert(not d.expired())
+
+        connect, read = d.timeouts()
+        assert(connect == min(read, deadline._connect_timeout))
+        assert(read <= 2.5)
+
+        # Without a Lambda context, e.g. in tests, there is a default budget
+        d = deadline.Deadline.from_context(None)
+        assert(0 < d.remaining() <= deadline._default)
+
+    def test_expired(self):
+        d = deadline.Deadline(-1)
+        assert(d.expired())
+        assert(d.remaining() == 0)
+        with self.assertRaises(deadline.DeadlineExceeded):
+            d.timeouts()
+
+        # The handler answers a RuntimeError with an apology
+        assert(issubclass(deadline.DeadlineExceeded, RuntimeError))
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDeadline)
+    unittest.TextTestRunner(verbosity=2).run(suite)
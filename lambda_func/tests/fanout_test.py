@@ -0,0 +1,77 @@
+import unittest
+import threading
+import time
+from lambda_func import fanout
+
+
+class TestFanout(unittest.TestCase):
+
+    def test_first_useful(self):
+        def slow():
+            time.sleep(0.2)
+            return 'slow'
+
+        # The first call is preferred even if it is slower
+        start = time.time()
+        assert(fanout.first_useful([slow, lambda: 'fast']) == 'slow')
+
+        # A call that is not useful is skipped
+        assert(fanout.first_useful([lambda: '', lambda: 'b']) == 'b')
+
+        # The last result is returned if none of them is useful
+        assert(fanout.first_useful([lambda: 0, lambda: '']) == '')
+
+        # The calls are run at the same time
+        results = fanout.first_useful([slow, slow, slow])
+        assert(results == 'slow')
+        assert(time.time() - start < 0.6)
+
+    def test_errors(self):
+        def fail():
+            raise RuntimeError('failed')
+
+        assert(fanout.first_useful([fail, lambda: 'b']) == 'b')
+        assert(fanout.first_useful([lambda: '', fail]) == '')
+        with self.assertRaises(RuntimeError):
+            fanout.first_useful([fail, fail])
+
+        with self.assertRaises(fanout.TimeoutError):
+            fanout.first_useful([lambda: time.sleep(0.5)], timeout=0.05)
+
+    def test_cancel(self):
+        ran = []
+        release = threading.Event()
+
+        def call(name, seconds=0):
+            def run():
+                ran.append(name)
+                release.wait(seconds)
+                return name
+            return run
+
+        # Keep all the workers but one busy. The worker runs the preferred
+        # call and then the second one, and the last call is still queued
+        # when the preferred result turns out useful.
+        busy = [fanout.submit(call('busy', 1))
+                for _ in range(0, fanout._executor._max_workers - 1)]
+        try:
+            assert(fanout.first_useful([call('preferred'),
+                                        call('second', 0.2),
+                                        call('late')]) == 'preferred')
+        finally:
+            release.set()
+            for future in busy:
+                future.result()
+
+        # The queued call was cancelled, it does not run after the others
+        fanout.submit(lambda: None).result()
+        assert('preferred' in ran and 'late' not in ran)
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFanout)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,168 @@
+import unittest
+import json
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from lambda_func import finna
+from lambda_func.tests import fake_finna
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        if '/slow' in self.path:
+            time.sleep(0.5)
+        body = json.dumps({'path': self.path}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestFinna(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server(('127.0.0.1', 0), _Handler)
+        cls.server.connections = set()
+        cls.url = 'http://127.0.0.1:%d/api/v1/' % cls.server.server_port
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_keep_alive(self):
+        self.server.connections.clear()
+        transport = finna.HTTPTransport()
+
+        params = {'lookfor': ['cats'], 'filter[]': ['a', 'b'], 'id': [None]}
+        r = transport.request('GET', self.url + 'search', params)
+        assert(r.status_code == 200)
+        assert(r.json()['path'] ==
+               '/api/v1/search?filter%5B%5D=a&filter%5B%5D=b&lookfor=cats')
+
+        transport.request('GET', self.url + 'record', {'id': 'x'})
+        assert(len(self.server.connections) == 1)
+
+        # a connection that was closed is replaced
+        transport.close()
+        transport.request('GET', self.url + 'record', {'id': 'x'})
+        assert(len(self.server.connections) == 2)
+        transport.close()
+
+    def test_threads(self):
+        transport = finna.HTTPTransport(pool_size=2)
+        results = []
+
+        def fetch(i):
+            r = transport.request('GET', self.url + 'record', {'id': i})
+            results.append(r.json()['path'])
+
+        threads = [threading.Thread(target=fetch, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert(sorted(results) == ['/api/v1/record?id=%d' % i for i in range(8)])
+        transport.close()
+
+    def test_set_transport(self):
+        transport = finna.HTTPTransport()
+        previous = finna.set_transport(transport)
+        assert(finna.get_transport() is transport)
+        assert(finna.set_transport(previous) is transport)
+
+    def test_cache(self):
+        def respond(url, params):
+            if params.get('id') == 'missing':
+                return finna.Response(404, b'{}')
+            return params
+
+        directory = tempfile.mkdtemp()
+        memory, disk = finna._memory, finna._disk
+        finna._memory = finna.cache.LRUCache(16)
+        finna._disk = finna.cache.DiskCache(directory)
+        try:
+            with fake_finna(respond, finna, cached=True) as transport:
+                calls = transport.requests
+                r = finna.request('record', {'id': 'a'})
+                assert(r.json() == {'id': 'a'})
+                assert(finna.request('record', {'id': 'a'}).json() ==
+                       {'id': 'a'})
+                assert(len(calls) == 1)
+                assert(finna.cache_stats()['memory']['hits'] == 1)
+
+                # A new container still finds the response on disk
+                finna._memory.clear()
+                assert(finna.request('record', {'id': 'a'}).json() ==
+                       {'id': 'a'})
+                assert(len(calls) == 1)
+
+                # Only successful responses are cached
+                finna.request('record', {'id': 'missing'})
+                finna.request('record', {'id': 'missing'})
+                assert(len(calls) == 3)
+
+                # POST requests are not cached
+                finna.request('search', {'lookfor': 'x'}, 'POST')
+                finna.request('search', {'lookfor': 'x'}, 'POST')
+                assert(len(calls) == 5)
+
+                stats = finna.cache_stats()
+                assert(stats['disk']['hits'] == 1)
+                assert(stats['bytes_saved'] == 2 * len(r.body))
+        finally:
+            finna._memory, finna._disk = memory, disk
+            shutil.rmtree(directory)
+
+    def test_deadline(self):
+        # The module finna uses, which is imported without the package
+        Deadline = finna._deadline.Deadline
+        DeadlineExceeded = finna._deadline.DeadlineExceeded
+        api_url, ttl = finna.API_URL, finna._ttl
+        finna.API_URL = self.url
+        finna._ttl = {}
+        previous = finna.set_transport(finna.HTTPTransport())
+        try:
+            r = finna.request('search', {'lookfor': 'x'},
+                              deadline=Deadline(5))
+            assert(r.status_code == 200)
+
+            with self.assertRaises(DeadlineExceeded):
+                finna.request('slow', {}, deadline=Deadline(0.1))
+
+            # No request is sent when the time has run out
+            finna.reset_call_counts()
+            with self.assertRaises(DeadlineExceeded):
+                finna.request('search', {}, deadline=Deadline(-1))
+            assert(finna.call_counts()['sent'] == 0)
+        finally:
+            finna.set_transport(previous)
+            finna.API_URL, finna._ttl = api_url, ttl
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFinna)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,74 @@
+import unittest
+from lambda_func import query
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_parse(self):
+        q = query.parse('cats written by vogel steven published between '
+                        '2001 and 2003')
+        assert(q.subject == 'cats')
+        assert(q.author is None)
+        assert((q.lower, q.upper) == (2001, 2003))
+        assert(q.keywords == ['written', 'by', 'published'])
+
+        q = query.parse('computer science')
+        assert(q.subject == 'computer science' and q.end is None)
+        assert(q.filters() == [])
+
+        assert(query.parse('it is published 1987')[2:4] == (1987, 1987))
+        assert(query.parse('cats published before 1987')[2:4] == (None, 1987))
+        assert(query.parse('cats after 1987')[2:4] == (1987, None))
+        assert(query.parse('cats from 1987').subject == 'cats')
+
+        # A number alone is a part of the subject, unless the subject has
+        # already ended
+        q = query.parse('1984')
+        assert(q.subject == '1984' and q.filters() == [])
+        assert(query.parse('2001 a space odyssey').subject ==
+               '2001 a space odyssey')
+        q = query.parse('about the year 2000 problem')
+        assert(q.subject == 'about the year 2000 problem')
+        assert((q.lower, q.upper) == (None, None))
+        q = query.parse('cats books 2001')
+        assert(q.subject == 'cats' and (q.lower, q.upper) == (2001, 2001))
+
+        # Only whole words are keywords
+        assert(query.parse('bookkeeping books').subject == 'bookkeeping')
+
+    def test_filters(self):
+        q = query.parse('cats in 2001')._replace(author='vogel, steven')
+        assert(q.filters() == ['author:"vogel, steven"',
+                               'search_daterange_mv:"[2001 TO 2001]"'])
+        assert(query.date_filter(upper=1987) ==
+               'search_daterange_mv:"[0 TO 1987]"')
+
+    def test_find_author(self):
+        fname = 'authors_clean.txt'
+
+        q = query.find_author(query.parse('cats written by vogel steven'),
+                              fname)
+        assert(q.subject == 'cats' and q.author == 'vogel, steven')
+
+        # The author may follow the subject without keywords
+        q = query.find_author(query.parse('cats vogel steven'), fname)
+        assert(q.subject == 'cats' and q.author == 'vogel, steven')
+
+        # But not a name of one word, which is likely a part of the title
+        q = query.find_author(query.parse('lord of the rings'), fname)
+        assert(q.subject == 'lord of the rings' and q.author is None)
+
+        # The author is not looked for when there are only keywords and
+        # years after the subject, searching a missing list would fail
+        q = query.find_author(query.parse('cats books published in 2001'),
+                              'missing.txt')
+        assert(q.subject == 'cats' and q.author is None)
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestQuery)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,83 @@
+import unittest
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+from lambda_func import replay
+from lambda_func.benchmarks import book_info_load
+
+
+class _API(object):
+    """ Answers every request with a search that found nothing """
+
+    def request(self, method, url, params=None, headers=None, timeout=None):
+        body = {'status': 'OK', 'resultCount': 0, 'records': []}
+        return replay.finna.Response(200, json.dumps(body).encode('utf-8'))
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'fixtures.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record_replay(self):
+        recording = replay.RecordingTransport(_API())
+        recording.request('GET', 'http://x/search',
+                          {'lookfor': 'sähkö', 'filter[]': ['a', 'b']})
+        recording.save(self.fname)
+
+        store = replay.load(self.fname)
+        assert(store == recording.store)
+
+        transport = replay.ReplayTransport(store)
+        # The order of the parameters does not matter
+        r = transport.request('GET', 'http://x/search',
+                              {'filter[]': ['a', 'b'], 'lookfor': 'sähkö'})
+        assert(r.json()['status'] == 'OK')
+
+        with self.assertRaises(replay.UnmatchedRequest):
+            transport.request('GET', 'http://x/search', {'lookfor': 'cat'})
+        assert(transport.unmatched ==
+               ['GET http://x/search?lookfor=cat'])
+        assert(transport.requests == 2)
+
+    def test_latency(self):
+        store = {replay.request_key('GET', 'http://x/'): (200, b'{}')}
+        transport = replay.ReplayTransport(store, latency=0.05, jitter=0.01)
+        start = time.time()
+        transport.request('GET', 'http://x/')
+        assert(0.05 <= time.time() - start < 0.2)
+
+        # A response slower than the timeout times out
+        with self.assertRaises(socket.timeout):
+            transport.request('GET', 'http://x/', timeout=(0.01, 0.01))
+
+    def test_load(self):
+        events = book_info_load.load_events()
+        finna = replay.finna
+        previous = finna.set_transport(_API())
+        try:
+            book_info_load.record(events, self.fname)
+        finally:
+            finna.set_transport(previous)
+
+        result = book_info_load.run(events, replay.load(self.fname),
+                                    rounds=2, threads=2)
+        assert(result['unmatched'] == [])
+        assert(result['turns'] == 2 * len(events))
+        assert(set(result['intents']) == {'FindBook', 'ExtraInfo', 'Author'})
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestReplay)
+    unittest.TextTestRunner(verbosity=2).run(suite)
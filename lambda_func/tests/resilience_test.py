@@ -0,0 +1,191 @@
+import unittest
+import socket
+import threading
+import time
+from lambda_func import resilience
+
+
+class _Response(object):
+    def __init__(self, status_code, body=b''):
+        self.status_code = status_code
+        self.body = body
+
+
+class _Transport(object):
+    """ Answers with the given results in turn, an exception is raised """
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, headers=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+            result = self.results.pop(0) if self.results else _Response(200)
+        if callable(result):
+            result = result()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestResilience(unittest.TestCase):
+
+    def test_retry(self):
+        inner = _Transport([ConnectionResetError(), _Response(503),
+                            _Response(200, b'ok')])
+        transport = resilience.ResilientTransport(inner, backoff=0.001)
+        assert(transport.request('GET', 'http://x/').body == b'ok')
+        assert(inner.calls == 3)
+        assert(transport.stats()['retried'] == 2)
+
+        # The last response is returned when the retries run out
+        inner = _Transport([_Response(503)] * 3)
+        transport = resilience.ResilientTransport(inner, backoff=0.001)
+        assert(transport.request('GET', 'http://x/').status_code == 503)
+
+        inner = _Transport([ConnectionResetError()] * 3)
+        transport = resilience.ResilientTransport(inner, backoff=0.001)
+        with self.assertRaises(ConnectionResetError):
+            transport.request('GET', 'http://x/')
+
+        # Only GET requests are retried
+        inner = _Transport([ConnectionResetError()])
+        transport = resilience.ResilientTransport(inner, backoff=0.001)
+        with self.assertRaises(ConnectionResetError):
+            transport.request('POST', 'http://x/')
+        assert(inner.calls == 1)
+
+    def test_retry_timeout(self):
+        # The retries are not waited for past the timeout
+        inner = _Transport([ConnectionResetError()] * 10)
+        transport = resilience.ResilientTransport(inner, retries=10,
+                                                  backoff=1, max_backoff=1)
+        start = time.time()
+        with self.assertRaises(ConnectionResetError):
+            transport.request('GET', 'http://x/', timeout=(0.05, 0.05))
+        assert(time.time() - start < 0.5)
+
+    def test_circuit_breaker(self):
+        inner = _Transport([ConnectionResetError()] * 3)
+        transport = resilience.ResilientTransport(
+            inner, retries=0, failure_threshold=3, reset_timeout=0.1)
+
+        for _ in range(0, 3):
+            with self.assertRaises(ConnectionResetError):
+                transport.request('GET', 'http://x/')
+        assert(transport.stats()['state'] == 'open')
+
+        # Fails fast without sending the request
+        with self.assertRaises(resilience.CircuitOpenError):
+            transport.request('GET', 'http://x/')
+        assert(inner.calls == 3)
+        assert(transport.stats()['short_circuited'] == 1)
+
+        # After a while a request is tried again, and it closes the breaker
+        time.sleep(0.15)
+        assert(transport.request('GET', 'http://x/').status_code == 200)
+        assert(transport.stats()['state'] == 'closed')
+
+    def test_half_open(self):
+        tried = threading.Event()
+        release = threading.Event()
+
+        def probe():
+            tried.set()
+            release.wait(1)
+            return _Response(200)
+
+        inner = _Transport([ConnectionResetError(), probe])
+        transport = resilience.ResilientTransport(
+            inner, retries=0, failure_threshold=1, reset_timeout=0.05)
+        with self.assertRaises(ConnectionResetError):
+            transport.request('GET', 'http://x/')
+        time.sleep(0.1)
+
+        # Only one request tries the API while the breaker is half-open
+        thread = threading.Thread(
+            target=transport.request, args=('GET', 'http://x/'))
+        thread.start()
+        assert(tried.wait(1))
+        for _ in range(0, 3):
+            with self.assertRaises(resilience.CircuitOpenError):
+                transport.request('GET', 'http://x/')
+        release.set()
+        thread.join()
+        assert(inner.calls == 2)
+        assert(transport.stats()['state'] == 'closed')
+
+    def test_hedge(self):
+        def slow():
+            time.sleep(0.5)
+            return _Response(200, b'slow')
+
+        inner = _Transport([_Response(200)] * 5 +
+                           [slow, _Response(200, b'fast')])
+        transport = resilience.ResilientTransport(inner, hedge_samples=5)
+        assert(transport.hedge_delay() is None)
+        for _ in range(0, 5):
+            transport.request('GET', 'http://x/')
+        assert(transport.hedge_delay() is not None)
+
+        start = time.time()
+        assert(transport.request('GET', 'http://x/').body == b'fast')
+        assert(time.time() - start < 0.4)
+
+        stats = transport.stats()
+        assert(stats['hedged'] == 1 and stats['hedge_wins'] == 1)
+
+    def test_hedge_timeout(self):
+        timeouts = []
+
+        def slow(seconds):
+            def request():
+                time.sleep(seconds)
+                return _Response(200)
+            return request
+
+        # The requests take the read timeout they are given, and time out
+        class Transport(_Transport):
+            def request(self, method, url, params=None, headers=None,
+                        timeout=None):
+                if timeout is None:
+                    return _Transport.request(self, method, url, params)
+                timeouts.append(timeout)
+                time.sleep(timeout[1])
+                raise socket.timeout('timed out')
+
+        inner = Transport([slow(0.1)] * 5)
+        transport = resilience.ResilientTransport(inner, hedge_samples=5)
+        for _ in range(0, 5):
+            transport.request('GET', 'http://x/')
+
+        # The hedge gets what is left of the timeout, so the request does
+        # not take longer than the timeout, however slow the API is
+        start = time.time()
+        with self.assertRaises(socket.timeout):
+            transport.request('GET', 'http://x/', timeout=(0.3, 0.3))
+        assert(time.time() - start < 0.38)
+        assert(timeouts[0][1] > 0.29)
+        assert(timeouts[1][1] < 0.25 and timeouts[1][0] == timeouts[1][1])
+
+    def test_no_time_left(self):
+        # A request with no time left, e.g. a retry after a backoff that
+        # overslept, is not sent with a timeout of 0, which would make the
+        # socket non-blocking and count against the breaker
+        inner = _Transport([])
+        transport = resilience.ResilientTransport(inner)
+        with self.assertRaises(socket.timeout):
+            transport.request('GET', 'http://x/', timeout=(0.0, 0.0))
+        assert(inner.calls == 0)
+        assert(transport.stats()['failures'] == 0)
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestResilience)
+    unittest.TextTestRunner(verbosity=2).run(suite)
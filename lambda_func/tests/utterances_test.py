@@ -0,0 +1,38 @@
+import unittest
+from lambda_func import utterances
+
+
+class TestUtterances(unittest.TestCase):
+
+    def test_longest(self):
+        trie = utterances.PrefixTrie(['find', 'find books', 'where is',
+                                      "i'm looking for", "i'm looking for a"])
+
+        assert(trie.strip('find books about cats') == 'about cats')
+        assert(trie.strip('find cats') == 'cats')
+        assert(trie.strip("i'm looking for a cat book") == 'cat book')
+        assert(trie.strip('where is') == '')
+        assert(trie.strip('tell me cats') == 'tell me cats')
+
+        # Only whole words are stripped
+        assert(trie.strip('findings') == 'findings')
+        assert(trie.strip("i'm looking for abc") == 'abc')
+
+    def test_files(self):
+        assert(utterances.subject.strip('where can i find books about cats')
+               == 'about cats')
+        assert(utterances.subject.strip('where can i find book cats')
+               == 'cats')
+        assert(utterances.subject.strip('tell me where is the cat book')
+               == 'cat book')
+        assert(utterances.author.strip('what books are written by '
+                                       'donald hearn') == 'donald hearn')
+
+
+def main():  # pragma: no cover
+    print("Main function")
+
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestUtterances)
+    unittest.TextTestRunner(verbosity=2).run(suite)
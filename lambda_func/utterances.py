@@ -0,0 +1,75 @@
+"""
+Strips the carrier phrase, e.g. "where can i find", from the start of a
+transcript.
+
+The sample utterances are compiled once, when the module is imported, into
+a trie of their characters. The longest utterance that the transcript
+starts with is then found with one walk over the transcript, however many
+utterances there are. An utterance only matches whole words, so "find"
+is not stripped from "findings".
+"""
+
+import os
+
+_here = os.path.dirname(os.path.abspath(__file__))
+
+# Marks the node where an utterance ends
+_END = None
+
+
+class PrefixTrie(object):
+    """ A trie of phrases that finds the longest one a text starts with """
+
+    def __init__(self, phrases=()):
+        self._root = {}
+        for phrase in phrases:
+            self.add(phrase)
+
+    def add(self, phrase):
+        node = self._root
+        for c in phrase:
+            node = node.setdefault(c, {})
+        node[_END] = True
+
+    def longest(self, text):
+        """
+        :return: the length of the longest phrase that text starts with,
+        0 if there is none
+        """
+        node = self._root
+        longest = 0
+        for i, c in enumerate(text):
+            node = node.get(c)
+            if node is None:
+                return longest
+            if _END in node and (i + 1 == len(text) or text[i + 1] == ' '):
+                longest = i + 1
+        return longest
+
+    def strip(self, text):
+        """ :return: text without the phrase it starts with """
+        return text[self.longest(text):].strip()
+
+
+def compile_file(fname, suffixes=()):
+    """
+    Compiles a file of utterances, one per line
+    :param fname: the file, relative to this folder
+    :param suffixes: words that are also matched after every utterance,
+    e.g. "books" for "where can i find books"
+    :return: a PrefixTrie
+    """
+    trie = PrefixTrie()
+    with open(os.path.join(_here, fname), 'r') as f:
+        for line in f:
+            line = ' '.join(line.split())
+            if line:
+                trie.add(line)
+                for suffix in suffixes:
+                    trie.add(line + ' ' + suffix)
+    return trie
+
+
+# The utterances of the FindBook and Author intents
+subject = compile_file('sample_utterances.txt', ['book', 'books'])
+author = compile_file('author_utterances.txt')